@@ -3,8 +3,7 @@
 import re
 from subprocess import check_output
 
-import click
-
+from vcd_cli.manifest import get_manifest
 from vcd_cli.vcd import vcd
 
 command_list = []
@@ -50,13 +49,13 @@ def generate_page(cmd_str):
 def process_command(cmd, ancestors=[]):
     cmd_str = ''
     for a in ancestors:
-        cmd_str += a.name + ' '
-    cmd_str += cmd.name
+        cmd_str += a['name'] + ' '
+    cmd_str += cmd['name']
     command_list.append(cmd_str)
-    if type(cmd) == click.core.Group:
-        for k in sorted(cmd.commands.keys()):
+    if cmd['commands'] is not None:
+        for k in sorted(cmd['commands'].keys()):
             a = ancestors + [cmd]
-            process_command(cmd.commands[k], ancestors=a)
+            process_command(cmd['commands'][k], ancestors=a)
 
 
 try:
@@ -67,7 +66,9 @@ try:
     output = check_output(['git', 'rm', '-rf', 'docs/commands.md'])
 except Exception as e:
     print(e)
-process_command(vcd)
+# describe the commands as they are, the cached manifest is only rebuilt for
+# a new version, and save them for the help pages run below
+process_command(get_manifest(vcd, rebuild=True)['command'])
 generate_index_page(command_list)
 for cmd_str in command_list:
     generate_page(cmd_str)
@@ -0,0 +1,92 @@
+# VMware vCloud Director vCD CLI
+# Copyright (c) 2018 VMware, Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from click.testing import CliRunner
+
+from vcd_cli.profiles import Profiles
+from vcd_cli.vcd import vcd
+
+
+class BatchProfileTest(unittest.TestCase):
+    """Test the profile used by the commands of 'vcd batch'.
+
+    The profiles file is written to a temporary HOME and clients are
+    stand-ins, no vCD is needed.
+    """
+
+    def setUp(self):
+        self._home = tempfile.mkdtemp()
+        self._env = mock.patch.dict(os.environ, {'HOME': self._home})
+        self._env.start()
+        os.environ.pop('VCD_PROFILE', None)
+        path = os.path.join(self._home, '.vcd-cli', 'profiles.yaml')
+        for name in ['default', 'p2']:
+            profiles = Profiles.load(path=path, name=name)
+            profiles.update('%s.example.com' % name, 'org', 'user-' + name,
+                            'token-' + name, '33.0', True, False, 'vdc',
+                            'org_href', 'vdc_href', False, False, False,
+                            'vapp', 'vapp_href')
+        self._clients = []
+        self._create_client = mock.patch(
+            'vcd_cli.utils.create_client', side_effect=self._client)
+        self._create_client.start()
+
+    def tearDown(self):
+        self._create_client.stop()
+        self._env.stop()
+        shutil.rmtree(self._home)
+
+    def _client(self, profiles):
+        self._clients.append(profiles.name)
+        return mock.Mock()
+
+    def _batch(self, *args, script):
+        result = CliRunner().invoke(
+            vcd, list(args) + ['batch', '-'], input=script)
+        self.assertEqual(0, result.exit_code, result.output)
+        return [json.loads(line) for line in result.output.splitlines()]
+
+    def test_0010_profile_of_batch(self):
+        """Commands use the profile selected for the batch."""
+        reports = self._batch(
+            '--profile', 'p2', script='--json pwd\n--json pwd\n')
+        for report in reports:
+            self.assertEqual('user-p2', json.loads(report['output'])['user'])
+        # one client, shared by the batch and its commands
+        self.assertEqual(['p2'], self._clients)
+
+    def test_0020_profile_of_command(self):
+        """A command selecting a profile uses it instead."""
+        reports = self._batch(
+            '--profile', 'p2', script='--json --profile default pwd\n')
+        self.assertEqual('user-default',
+                         json.loads(reports[0]['output'])['user'])
+
+    def test_0030_default_profile(self):
+        """Without --profile, commands use the default profile."""
+        reports = self._batch(script='--json pwd\n')
+        self.assertEqual('user-default',
+                         json.loads(reports[0]['output'])['user'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,179 @@
+# VMware vCloud Director vCD CLI
+# Copyright (c) 2018 VMware, Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+
+from lxml import objectify
+
+from vcd_cli.inventory import event_entity
+from vcd_cli.inventory import Inventory
+from vcd_cli.inventory import SCHEMA_VERSION
+from vcd_cli.inventory import sync_kinds
+
+HOST = 'https://vcd.example.com'
+VM_IDS = ['6ba0f7a5-31e3-4c1a-9b7c-0f2e5c3e1d1%d' % n for n in range(4)]
+
+
+def vm_record(vm_id, name, status='POWERED_ON'):
+    return objectify.Element(
+        'VMRecord',
+        id='urn:vcloud:vm:' + vm_id,
+        href='%s/api/vApp/vm-%s' % (HOST, vm_id),
+        name=name,
+        status=status,
+        vdc='%s/api/vdc/vdc1' % HOST,
+        vdcName='vdc1',
+        isVAppTemplate='false')
+
+
+def event_record(entity):
+    return objectify.Element('EventRecord', entity=entity)
+
+
+class FakeQuery(object):
+    def __init__(self, records):
+        self.records = records
+
+    def execute(self):
+        return iter(self.records)
+
+
+class FakeClient(object):
+    """Stands in for a pyvcloud client, serving VM and event queries."""
+
+    def __init__(self):
+        self.vms = []
+        self.events = []
+        self.queries = []
+
+    def is_sysadmin(self):
+        return False
+
+    def get_typed_query(self, resource_type, query_result_format, page_size,
+                        qfilter):
+        self.queries.append((resource_type, qfilter))
+        if resource_type == 'event':
+            return FakeQuery(self.events)
+        records = self.vms
+        if qfilter.startswith('id=='):
+            ids = [i.split(':')[-1] for i in qfilter.split(',')]
+            records = [r for r in records if r.get('id').split(':')[-1] in ids]
+        return FakeQuery(records)
+
+
+class InventoryTest(unittest.TestCase):
+    """Test the inventory snapshot with a stand-in client.
+
+    The snapshot is kept in a temporary directory, no vCD is needed.
+    """
+
+    def setUp(self):
+        self._dir = tempfile.mkdtemp()
+        self._path = os.path.join(self._dir, 'inventory.db')
+        self._inv = Inventory(self._path)
+
+    def tearDown(self):
+        self._inv.close()
+        shutil.rmtree(self._dir)
+
+    def _names(self):
+        return [r['name'] for r in self._inv.query('vm')]
+
+    def test_0010_merge_counts(self):
+        """Merging counts the records added, changed and removed."""
+        records = [vm_record(VM_IDS[n], 'vm%d' % n) for n in range(3)]
+        self.assertEqual((3, 0, 0), self._inv.merge('vm', 'vm', records))
+        # unchanged records aren't written again
+        self.assertEqual((0, 0, 0), self._inv.merge('vm', 'vm', records))
+        records = [
+            vm_record(VM_IDS[0], 'vm0'),
+            vm_record(VM_IDS[1], 'vm1', status='POWERED_OFF'),
+            vm_record(VM_IDS[3], 'vm3')
+        ]
+        self.assertEqual((1, 1, 1), self._inv.merge('vm', 'vm', records))
+        self.assertEqual(['vm0', 'vm1', 'vm3'], self._names())
+        self.assertEqual('POWERED_OFF',
+                         self._inv.query('vm', name='vm1')[0]['status'])
+        self.assertEqual(3, self._inv.sync_state('vm')[2])
+
+    def test_0020_merge_subset(self):
+        """Merging a subset removes only the missing records among it."""
+        records = [vm_record(VM_IDS[n], 'vm%d' % n) for n in range(3)]
+        self._inv.merge('vm', 'vm', records)
+        result = self._inv.merge(
+            'vm', 'vm', [vm_record(VM_IDS[0], 'vm0-renamed')],
+            ids={VM_IDS[0], VM_IDS[1]})
+        self.assertEqual((0, 1, 1), result)
+        self.assertEqual(['vm0-renamed', 'vm2'], self._names())
+
+    def test_0030_event_entity(self):
+        """The kind and id of event entities are found in urns and hrefs."""
+        vm_id = VM_IDS[0]
+        self.assertEqual(('vm', vm_id), event_entity('urn:vcloud:vm:' + vm_id))
+        self.assertEqual(('vm', vm_id),
+                         event_entity('%s/api/vApp/vm-%s' % (HOST, vm_id)))
+        self.assertEqual(('vapp', vm_id),
+                         event_entity('%s/api/vApp/vapp-%s/' % (HOST, vm_id)))
+        self.assertEqual(('gateway', vm_id),
+                         event_entity('%s/api/admin/edgeGateway/%s' %
+                                      (HOST, vm_id)))
+        self.assertEqual(('catalog-item', vm_id),
+                         event_entity('urn:vcloud:catalogitem:' + vm_id))
+        self.assertIsNone(event_entity('urn:vcloud:task:' + vm_id))
+        self.assertIsNone(event_entity(None))
+
+    def test_0040_schema_version(self):
+        """A snapshot of another schema version is started over."""
+        self._inv.merge('vm', 'vm', [vm_record(VM_IDS[0], 'vm0')])
+        self._inv.close()
+        conn = sqlite3.connect(self._path)
+        conn.execute('PRAGMA user_version = %d' % (SCHEMA_VERSION - 1))
+        conn.close()
+        self._inv = Inventory(self._path)
+        self.assertEqual([], self._names())
+        self.assertIsNone(self._inv.sync_state('vm'))
+        version = self._inv.conn.execute('PRAGMA user_version').fetchone()[0]
+        self.assertEqual(SCHEMA_VERSION, version)
+
+    def test_0050_sync(self):
+        """Kinds are fetched entirely, then only their changed entities."""
+        client = FakeClient()
+        client.vms = [vm_record(VM_IDS[n], 'vm%d' % n) for n in range(3)]
+        result = sync_kinds(client, self._inv, ['vm'])
+        self.assertEqual('full', result[0]['mode'])
+        self.assertEqual(3, result[0]['added'])
+
+        client.vms[1] = vm_record(VM_IDS[1], 'vm1', status='POWERED_OFF')
+        del client.vms[2]
+        client.events = [
+            event_record('urn:vcloud:vm:' + VM_IDS[1]),
+            event_record('%s/api/vApp/vm-%s' % (HOST, VM_IDS[2]))
+        ]
+        client.queries = []
+        result = sync_kinds(client, self._inv, ['vm'])
+        self.assertEqual('events', result[0]['mode'])
+        self.assertEqual(2, len(client.queries))
+        self.assertIn(VM_IDS[2], client.queries[1][1])
+        self.assertEqual((0, 1, 1), (result[0]['added'], result[0]['changed'],
+                                     result[0]['removed']))
+        self.assertEqual(['vm0', 'vm1'], self._names())
+
+
+if __name__ == '__main__':
+    unittest.main()
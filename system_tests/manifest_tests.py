@@ -0,0 +1,70 @@
+# VMware vCloud Director vCD CLI
+# Copyright (c) 2018 VMware, Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+
+
+class ManifestTest(unittest.TestCase):
+    """Test the help listings served from the command manifest.
+
+    vcd runs in a process of its own, with HOME set to an empty directory,
+    so there is no ~/.vcd-cli/commands.json to start with. No vCD is needed.
+    """
+
+    def setUp(self):
+        self._home = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self._home)
+
+    def _vcd(self, *args):
+        env = dict(os.environ, HOME=self._home)
+        command = [sys.executable, '-c', 'from vcd_cli.vcd import vcd; vcd()']
+        return subprocess.run(
+            command + list(args),
+            env=env,
+            cwd=self._home,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            universal_newlines=True,
+            timeout=120)
+
+    def test_0010_help_without_manifest(self):
+        """vcd -h builds the manifest when there is none."""
+        result = self._vcd('-h')
+        self.assertEqual(0, result.returncode, result.stderr)
+        self.assertIn('vapp', result.stdout)
+        self.assertTrue(
+            os.path.exists(
+                os.path.join(self._home, '.vcd-cli', 'commands.json')))
+
+    def test_0020_help_with_stale_manifest(self):
+        """vcd -h rebuilds a manifest of another version."""
+        os.makedirs(os.path.join(self._home, '.vcd-cli'))
+        with open(os.path.join(self._home, '.vcd-cli', 'commands.json'),
+                  'w') as f:
+            f.write('{"version": "0", "extensions": [], "command": {}}')
+        result = self._vcd('-h')
+        self.assertEqual(0, result.returncode, result.stderr)
+        self.assertIn('vapp', result.stdout)
+
+
+if __name__ == '__main__':
+    unittest.main()
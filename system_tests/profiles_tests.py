@@ -0,0 +1,88 @@
+# VMware vCloud Director vCD CLI
+# Copyright (c) 2018 VMware, Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import multiprocessing
+import os
+import shutil
+import tempfile
+import unittest
+
+import yaml
+
+from vcd_cli.profiles import Profiles
+
+# Number of processes updating the profiles file at the same time.
+PROCESSES = 16
+
+
+def update_profile(path, start, n):
+    """Update profile n, and property n of the shared profile."""
+    start.wait()
+    profiles = Profiles.load(path=path, name='p%d' % n)
+    profiles.update('host%d' % n, 'org', 'user%d' % n, 'token%d' % n, '33.0',
+                    True, False, 'vdc', 'org_href', 'vdc_href', False, False,
+                    False, 'vapp', 'vapp_href')
+    profiles = Profiles.load(path=path, name='shared')
+    profiles.set('property%d' % n, n)
+
+
+class ProfilesTest(unittest.TestCase):
+    """Test concurrent updates of the profiles file.
+
+    The processes update a profiles file in a temporary directory, no vCD
+    is needed.
+    """
+
+    def setUp(self):
+        self._dir = tempfile.mkdtemp()
+        self._path = os.path.join(self._dir, 'profiles.yaml')
+        profiles = Profiles.load(path=self._path, name='shared')
+        profiles.update('host', 'org', 'user', 'token', '33.0', True, False,
+                        'vdc', 'org_href', 'vdc_href', False, False, False,
+                        'vapp', 'vapp_href')
+
+    def tearDown(self):
+        shutil.rmtree(self._dir)
+
+    def test_0010_concurrent_updates(self):
+        """No update made by processes at the same time is lost."""
+        context = multiprocessing.get_context('fork')
+        start = context.Event()
+        processes = [
+            context.Process(
+                target=update_profile, args=(self._path, start, n))
+            for n in range(PROCESSES)
+        ]
+        for process in processes:
+            process.start()
+        start.set()
+        for process in processes:
+            process.join(60)
+            self.assertEqual(0, process.exitcode)
+
+        with open(self._path, 'r') as f:
+            data = yaml.safe_load(f)
+        profiles = {p['name']: p for p in data['profiles']}
+        self.assertEqual(
+            set(['shared'] + ['p%d' % n for n in range(PROCESSES)]),
+            set(profiles.keys()))
+        for n in range(PROCESSES):
+            self.assertEqual('token%d' % n, profiles['p%d' % n]['token'])
+            self.assertEqual(n, profiles['shared']['property%d' % n])
+        self.assertEqual('token', profiles['shared']['token'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,138 @@
+# VMware vCloud Director vCD CLI
+# Copyright (c) 2018 VMware, Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import threading
+import time
+import unittest
+
+from vcd_cli.task_events import TaskEventListener
+from vcd_cli.task_waiter import TaskWaiter
+
+TASK_UUID = '6ba0f7a5-31e3-4c1a-9b7c-0f2e5c3e1d11'
+OTHER_TASK_UUID = '0c4d8e2b-7f1a-4b6e-8d3c-5a9f1e2b7c44'
+TASK_HREF = 'https://vcd.example.com/api/task/' + TASK_UUID
+
+
+class FakeMethod(object):
+    def __init__(self, queue=None, routing_key=None):
+        self.queue = queue
+        self.routing_key = routing_key
+
+
+class FakeDeclareOk(object):
+    def __init__(self, queue):
+        self.method = FakeMethod(queue=queue)
+
+
+class FakeChannel(object):
+    """Stands in for a pika channel, messages are delivered by the test."""
+
+    def __init__(self):
+        self.bindings = []
+        self.callback = None
+        self.stopped = threading.Event()
+
+    def queue_declare(self, queue, exclusive):
+        return FakeDeclareOk('amq.gen-test')
+
+    def queue_bind(self, exchange, queue, routing_key):
+        self.bindings.append((exchange, queue, routing_key))
+
+    def basic_consume(self, queue, on_message_callback, auto_ack):
+        self.callback = on_message_callback
+
+    def start_consuming(self):
+        self.stopped.wait()
+
+    def stop_consuming(self):
+        self.stopped.set()
+
+    def deliver(self, routing_key):
+        self.callback(self, FakeMethod(routing_key=routing_key), None, b'')
+
+
+class FakeConnection(object):
+    def __init__(self):
+        self.fake_channel = FakeChannel()
+        self.closed = False
+
+    def channel(self):
+        return self.fake_channel
+
+    def add_callback_threadsafe(self, callback):
+        callback()
+
+    def close(self):
+        self.closed = True
+
+
+class TaskEventsTest(unittest.TestCase):
+    """Test listening for task events with a stand-in AMQP broker.
+
+    No vCD or broker is needed.
+    """
+
+    def setUp(self):
+        self._connection = FakeConnection()
+        self._listener = TaskEventListener(
+            {'exchange': 'vcd'}, connect=lambda settings: self._connection)
+
+    def tearDown(self):
+        self._listener.stop()
+
+    def test_0010_event_before_timeout(self):
+        """An event of a task wakes up the waiter before the timeout."""
+        self._listener.start([TASK_UUID])
+        channel = self._connection.fake_channel
+        self.assertEqual([('vcd', 'amq.gen-test', '*.%s.#' % TASK_UUID)],
+                         channel.bindings)
+        timer = threading.Timer(
+            0.1, channel.deliver,
+            ('operationSuccess.%s.org.user.com.vmware.vcloud.event.task-'
+             'complete' % TASK_UUID, ))
+        timer.start()
+        start = time.time()
+        arrived = self._listener.wait({TASK_UUID}, 10)
+        timer.join()
+        self.assertEqual({TASK_UUID}, arrived)
+        self.assertLess(time.time() - start, 5)
+
+    def test_0020_other_task_ignored(self):
+        """An event of another task doesn't wake up the waiter."""
+        self._listener.start([TASK_UUID])
+        self._connection.fake_channel.deliver(
+            'operationSuccess.%s.org.user' % OTHER_TASK_UUID)
+        self.assertEqual(set(), self._listener.wait({TASK_UUID}, 0.2))
+
+    def test_0030_broker_unavailable(self):
+        """Tasks are polled when the broker can't be reached."""
+
+        def connect(settings):
+            raise ConnectionError('connection refused')
+
+        listener = TaskEventListener({'exchange': 'vcd'}, connect=connect)
+        waiter = TaskWaiter(None, events=listener)
+        waiter.add(TASK_HREF)
+        self.assertIsNone(waiter.start_events())
+
+    def test_0040_stop(self):
+        """Stopping the listener closes the connection."""
+        self._listener.start([TASK_UUID])
+        self._listener.stop()
+        self.assertTrue(self._connection.closed)
+
+
+if __name__ == '__main__':
+    unittest.main()
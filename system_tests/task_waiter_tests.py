@@ -0,0 +1,181 @@
+# VMware vCloud Director vCD CLI
+# Copyright (c) 2018 VMware, Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+
+from lxml import objectify
+from pyvcloud.vcd.exceptions import TaskTimeoutException
+
+from vcd_cli.task_waiter import PollPolicy
+from vcd_cli.task_waiter import QUERY_BATCH_SIZE
+from vcd_cli.task_waiter import TaskWaiter
+
+TASK_HREF = 'https://vcd.example.com/api/task/6ba0f7a5-31e3-4c1a-9b7c-%012d'
+
+
+class FakeQuery(object):
+    def __init__(self, records):
+        self.records = records
+
+    def execute(self):
+        return iter(self.records)
+
+
+class FakeClient(object):
+    """Stands in for a pyvcloud client, serving task queries.
+
+    Each task is running until it has been polled the number of times
+    given for it, and is successful from then on.
+    """
+
+    def __init__(self, polls):
+        self.polls = dict(polls)
+        self.queries = []
+        self.fetched = []
+
+    def is_sysadmin(self):
+        return False
+
+    def status(self, href):
+        self.polls[href] -= 1
+        return 'success' if self.polls[href] <= 0 else 'running'
+
+    def get_typed_query(self, resource_type, query_result_format, page_size,
+                        qfilter):
+        ids = [f.split(':')[-1] for f in qfilter.split(',')]
+        self.queries.append(ids)
+        records = [
+            objectify.Element(
+                'TaskRecord', href=href, status=self.status(href))
+            for href in self.polls if href.split('/')[-1] in ids
+        ]
+        return FakeQuery(records)
+
+    def get_resource(self, href):
+        self.fetched.append(href)
+        status = 'success' if self.polls[href] <= 0 else self.status(href)
+        return objectify.Element('Task', href=href, status=status)
+
+
+class TaskWaiterTest(unittest.TestCase):
+    """Test waiting for tasks with a stand-in client.
+
+    No vCD is needed.
+    """
+
+    def _waiter(self, polls, policy=None):
+        client = FakeClient(polls)
+        waiter = TaskWaiter(client, policy=policy)
+        for href in polls:
+            waiter.add(href)
+        return client, waiter
+
+    def test_0010_batched_query(self):
+        """Pending tasks are polled with one query per batch of ids."""
+        hrefs = [TASK_HREF % n for n in range(2 * QUERY_BATCH_SIZE + 10)]
+        client, waiter = self._waiter({href: 1 for href in hrefs})
+        finished = waiter.poll()
+        self.assertEqual([QUERY_BATCH_SIZE, QUERY_BATCH_SIZE, 10],
+                         [len(ids) for ids in client.queries])
+        self.assertEqual(set(hrefs), set(finished.keys()))
+        for href, task in finished.items():
+            self.assertEqual(href, task.get('href'))
+            self.assertEqual('Task', task.tag)
+        # each final task is fetched in full, once
+        self.assertEqual(sorted(hrefs), sorted(client.fetched))
+
+    def test_0020_records_matched(self):
+        """Query records update their pending task until it is final."""
+        first, second = TASK_HREF % 1, TASK_HREF % 2
+        client, waiter = self._waiter({first: 1, second: 2})
+        self.assertEqual([first], list(waiter.poll().keys()))
+        self.assertEqual('running', waiter.pending[second].get('status'))
+        self.assertEqual([first], client.fetched)
+        del waiter.pending[first]
+        # a single pending task is fetched directly
+        self.assertEqual([second], list(waiter.poll().keys()))
+        self.assertEqual([first, second], client.fetched)
+        self.assertEqual(1, len(client.queries))
+
+    def test_0030_wait(self):
+        """Tasks are yielded as they finish."""
+        hrefs = [TASK_HREF % n for n in range(3)]
+        client, waiter = self._waiter({
+            hrefs[0]: 2,
+            hrefs[1]: 1,
+            hrefs[2]: 3
+        })
+        tasks = list(waiter.wait())
+        self.assertEqual([hrefs[1], hrefs[0], hrefs[2]],
+                         [task.get('href') for task in tasks])
+        self.assertEqual(3, waiter.complete)
+
+    def test_0040_timeout(self):
+        """Waiting gives up once the timeout of the policy expires."""
+        client, waiter = self._waiter(
+            {TASK_HREF % 1: 1000, TASK_HREF % 2: 1},
+            policy=PollPolicy('fixed', timeout=0.3))
+        tasks = []
+        with self.assertRaises(TaskTimeoutException) as cm:
+            for task in waiter.wait():
+                tasks.append(task)
+        self.assertEqual([TASK_HREF % 2], [t.get('href') for t in tasks])
+        self.assertIn('1 of 2 tasks complete', str(cm.exception))
+
+    def test_0050_fixed_intervals(self):
+        """fixed polls every FIXED_INTERVAL seconds."""
+        policy = PollPolicy('fixed')
+        interval = policy.first_interval()
+        intervals = [interval]
+        for elapsed in range(3):
+            interval = policy.next_interval(interval, elapsed, 50)
+            intervals.append(interval)
+        self.assertEqual([PollPolicy.FIXED_INTERVAL] * 4, intervals)
+
+    def test_0060_exponential_intervals(self):
+        """exponential doubles the interval, up to MAX_INTERVAL."""
+        policy = PollPolicy('exponential')
+        interval = policy.first_interval()
+        intervals = [interval]
+        for elapsed in range(7):
+            interval = policy.next_interval(interval, elapsed)
+            intervals.append(interval)
+        self.assertEqual([0.2, 0.4, 0.8, 1.6, 3.2, 6.4, 10, 10],
+                         [round(i, 6) for i in intervals])
+
+    def test_0070_adaptive_intervals(self):
+        """adaptive follows the progress reported by the tasks."""
+        policy = PollPolicy()
+        interval = policy.first_interval()
+        self.assertEqual(PollPolicy.MIN_INTERVAL, interval)
+        # without progress, the interval grows by half
+        self.assertAlmostEqual(0.3, policy.next_interval(interval, 1))
+        self.assertAlmostEqual(0.3, policy.next_interval(interval, 1, 0))
+        self.assertEqual(10, policy.next_interval(8, 1, 100))
+        # half of the remaining time, within MIN_INTERVAL and MAX_INTERVAL
+        self.assertAlmostEqual(2, policy.next_interval(interval, 4, 50))
+        self.assertEqual(0.2, policy.next_interval(interval, 1, 99))
+        self.assertEqual(10, policy.next_interval(interval, 100, 10))
+
+    def test_0080_policy_options(self):
+        """Timeouts of 0 wait forever and strategies are checked."""
+        self.assertIsNone(PollPolicy(timeout=0).timeout)
+        self.assertEqual(2.5, PollPolicy(timeout='2.5').timeout)
+        with self.assertRaisesRegex(Exception, 'unknown poll strategy'):
+            PollPolicy('linear')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,165 @@
+# vCloud CLI 0.1
+#
+# Copyright (c) 2014-2018 VMware, Inc. All Rights Reserved.
+#
+# This product is licensed to you under the
+# Apache License, Version 2.0 (the "License").
+# You may not use this product except in compliance with the License.
+#
+# This product may include a number of subcomponents with
+# separate copyright notices and license terms. Your use of the source
+# code for the these subcomponents is subject to the terms and
+# conditions of the subcomponent's license, as noted in the LICENSE file.
+#
+
+from concurrent.futures import as_completed
+from concurrent.futures import ThreadPoolExecutor
+import json
+import shlex
+import threading
+
+import click
+import yaml
+
+from vcd_cli.cache import ResolutionCache
+from vcd_cli.profiles import profile_name
+from vcd_cli.runner import run_command_captured
+from vcd_cli.runner import update_shared_state
+from vcd_cli.runner import with_profile
+from vcd_cli.utils import restore_session
+from vcd_cli.utils import stderr
+from vcd_cli.vcd import vcd
+
+
+@vcd.command(short_help='run a script of vcd commands')
+@click.pass_context
+@click.argument('script', metavar='<file|->', type=click.File('r'))
+@click.option(
+    '-p',
+    '--parallel',
+    metavar='<n>',
+    type=click.IntRange(min=1),
+    default=1,
+    help='Number of commands to run at a time')
+@click.option(
+    '-x',
+    '--stop-on-error',
+    is_flag=True,
+    default=False,
+    help='Do not run further commands after one fails')
+def batch(ctx, script, parallel, stop_on_error):
+    """Run a script of vcd commands in one process.
+
+\b
+    Description
+        Runs the vcd commands of a script, or of the standard input when
+        the script is '-', over one session. The commands are read one per
+        line, with or without the leading 'vcd'; empty lines and '#'
+        comments are skipped. A YAML list of command lines, or of lists of
+        arguments, is read as well. Commands use the profile selected for
+        the batch, e.g. with 'vcd --profile <name> batch', unless they
+        select another one with --profile.
+\b
+        With --parallel greater than 1, commands are run by a pool of
+        workers and must not depend on each other.
+\b
+        The status of every command is reported as one JSON object per
+        line as it completes, with the keys 'line', 'command', 'exit_code',
+        'status', 'output' and 'error'. With --stop-on-error, the commands
+        not started when one fails are reported with the status 'skipped'.
+        The exit code is 1 if any command failed.
+\b
+    Examples
+        vcd batch onboard.txt
+            Run the commands in file onboard.txt one after the other.
+\b
+        vcd batch --parallel 8 power-on.yaml
+            Run the commands of a YAML list, eight at a time.
+\b
+        grep -h 'vapp info' *.txt | vcd batch -
+            Run the commands read from the standard input.
+    """
+    try:
+        commands = parse_script(script.read())
+    except Exception as e:
+        stderr(e, ctx)
+        return
+    name = profile_name(ctx)
+    try:
+        restore_session(ctx)
+    except Exception:
+        # the script may start with a login
+        ctx.obj = {}
+    ctx.obj['resolution_cache'] = ResolutionCache()
+    # set once a command fails with --stop-on-error, checked by the workers
+    # before they start a command
+    stopped = threading.Event()
+
+    def run(command):
+        line, args = command
+        result = {
+            'line': line,
+            'command': ' '.join(shlex.quote(a) for a in args),
+            'exit_code': None,
+            'status': 'skipped',
+            'output': '',
+            'error': ''
+        }
+        if stopped.is_set():
+            return result
+        exit_code, output, error = run_command_captured(
+            with_profile(args, name), ctx.obj)
+        update_shared_state(ctx.obj, args, exit_code)
+        if exit_code != 0 and stop_on_error:
+            stopped.set()
+        result.update({
+            'exit_code': exit_code,
+            'status': 'success' if exit_code == 0 else 'error',
+            'output': output,
+            'error': error
+        })
+        return result
+
+    failed = False
+    with ThreadPoolExecutor(max_workers=parallel) as executor:
+        futures = [executor.submit(run, c) for c in commands]
+        for future in as_completed(futures):
+            result = future.result()
+            click.echo(json.dumps(result, sort_keys=True))
+            if result['status'] == 'error':
+                failed = True
+    if failed:
+        ctx.exit(1)
+
+
+def parse_script(text):
+    """Parse the text of a batch script into command lines.
+
+    :param str text: YAML list of commands, or one command per line.
+
+    :return: list of (line number, list of arguments) tuples.
+
+    :rtype: list
+    """
+    commands = []
+    try:
+        items = yaml.safe_load(text)
+    except yaml.YAMLError:
+        items = None
+    if isinstance(items, list):
+        for n, item in enumerate(items, 1):
+            if isinstance(item, list):
+                args = [str(a) for a in item]
+            else:
+                args = shlex.split(str(item), comments=True)
+            commands.append((n, args))
+    else:
+        for n, line in enumerate(text.splitlines(), 1):
+            commands.append((n, shlex.split(line, comments=True)))
+    result = []
+    for n, args in commands:
+        if len(args) > 0 and args[0] == 'vcd':
+            args = args[1:]
+        if len(args) > 0:
+            result.append((n, args))
+    return result
@@ -0,0 +1,250 @@
+# vCloud CLI 0.1
+#
+# Copyright (c) 2014-2018 VMware, Inc. All Rights Reserved.
+#
+# This product is licensed to you under the
+# Apache License, Version 2.0 (the "License").
+# You may not use this product except in compliance with the License.
+#
+# This product may include a number of subcomponents with
+# separate copyright notices and license terms. Your use of the source
+# code for the these subcomponents is subject to the terms and
+# conditions of the subcomponent's license, as noted in the LICENSE file.
+#
+
+
+import json
+import os
+import tempfile
+import time
+
+from pyvcloud.vcd.exceptions import AccessForbiddenException
+from pyvcloud.vcd.exceptions import NotFoundException
+
+from vcd_cli.profiles import file_lock
+from vcd_cli.profiles import profile_file
+from vcd_cli.profiles import VCD_CLI_USER_PATH
+
+RESOLUTION_CACHE_PATH = VCD_CLI_USER_PATH + '/resolution-cache.json'
+
+# Seconds a name resolution is kept in the resolution cache file, unless the
+# profiles file sets 'resolution_cache_ttl'; 0 disables the file.
+DEFAULT_RESOLUTION_CACHE_TTL = 300
+
+
+class ResolutionCache(object):
+    """In-memory cache of entity name to href resolutions.
+
+    Keys are tuples starting with the kind of entity, followed by the href
+    of the containing entity and the names leading to it, e.g.
+    ('vm', vdc_href, vapp_name, vm_name).
+    """
+
+    def __init__(self):
+        self.entries = {}
+
+    def get(self, key):
+        return self.entries.get(key)
+
+    def put(self, key, href, resolved=None):
+        """Store the href a key resolves to.
+
+        :param tuple key: cache key of the entity.
+        :param str href: href of the entity.
+        :param float resolved: time the resolution started, now if None.
+        """
+        self.entries[key] = href
+
+    def invalidate(self, prefix):
+        """Drop the entries whose key starts with the given tuple."""
+        for key in [k for k in self.entries if k[:len(prefix)] == prefix]:
+            del self.entries[key]
+
+    def clear(self):
+        self.entries.clear()
+
+
+class PersistentResolutionCache(ResolutionCache):
+    """Resolution cache kept in a file, shared by consecutive vcd commands.
+
+    Entries expire ttl seconds after they are stored. Changes are recorded
+    and, on every change, replayed on the file as it is on disk, under an
+    exclusive lock, and the file is rewritten by atomic replacement, as the
+    profiles file is; processes sharing the file don't drop each other's
+    entries. Invalidations are kept in the file as tombstones for ttl
+    seconds, so that a name resolved before another process invalidated it
+    is not stored again afterwards.
+    """
+
+    def __init__(self, path=RESOLUTION_CACHE_PATH,
+                 ttl=DEFAULT_RESOLUTION_CACHE_TTL):
+        super(PersistentResolutionCache, self).__init__()
+        self.path = os.path.expanduser(path)
+        self.ttl = ttl
+        self.expires = {}
+        self.tombstones = []
+        self.changes = []
+        self.load(self.read())
+
+    def read(self):
+        try:
+            with open(self.path, 'r') as f:
+                return json.load(f)
+        except Exception:
+            return {}
+
+    def load(self, data):
+        """Take the unexpired entries and tombstones of the file data."""
+        now = time.time()
+        self.entries = {}
+        self.expires = {}
+        for key, href, expires in data.get('entries', []):
+            if expires > now:
+                self.entries[tuple(key)] = href
+                self.expires[tuple(key)] = expires
+        self.tombstones = [(tuple(prefix), invalidated)
+                           for prefix, invalidated in data.get(
+                               'tombstones', [])
+                           if invalidated + self.ttl > now]
+
+    def get(self, key):
+        if self.expires.get(key, 0) <= time.time():
+            return None
+        return self.entries.get(key)
+
+    def put(self, key, href, resolved=None):
+        self.changed(('put', key, href, resolved or time.time()))
+
+    def invalidate(self, prefix):
+        self.changed(('invalidate', tuple(prefix), time.time()))
+
+    def clear(self):
+        self.invalidate(())
+
+    def changed(self, change):
+        self.apply(change)
+        self.changes.append(change)
+        self.save()
+
+    def apply(self, change):
+        if change[0] == 'put':
+            _, key, href, stored = change
+            for prefix, invalidated in self.tombstones:
+                if key[:len(prefix)] == prefix and invalidated >= stored:
+                    # resolved before it was invalidated
+                    return
+            self.entries[key] = href
+            self.expires[key] = stored + self.ttl
+        else:
+            _, prefix, invalidated = change
+            super(PersistentResolutionCache, self).invalidate(prefix)
+            self.tombstones.append((prefix, invalidated))
+
+    def save(self):
+        try:
+            parent_dir = os.path.dirname(self.path)
+            if not os.path.exists(parent_dir):
+                os.makedirs(parent_dir)
+            with file_lock(self.path, exclusive=True):
+                self.load(self.read())
+                for change in self.changes:
+                    self.apply(change)
+                entries = [[list(k), href, self.expires[k]]
+                           for k, href in self.entries.items()]
+                tombstones = [[list(prefix), invalidated]
+                              for prefix, invalidated in self.tombstones]
+                fd, tmp_path = tempfile.mkstemp(dir=parent_dir)
+                with os.fdopen(fd, 'w') as f:
+                    json.dump({
+                        'entries': entries,
+                        'tombstones': tombstones
+                    }, f)
+                os.replace(tmp_path, self.path)
+            self.changes = []
+        except Exception:
+            pass
+
+
+def get_resolution_cache(ctx):
+    """Get the resolution cache of the context.
+
+    Shells and batches put an in-memory cache in the context object, other
+    commands use the cache file unless its ttl is set to 0.
+    """
+    if type(ctx.obj) is not dict:
+        return None
+    cache = ctx.obj.get('resolution_cache')
+    if cache is None and ctx.obj.get('profiles') is not None:
+        ttl = (ctx.obj['profiles'].data or {}).get(
+            'resolution_cache_ttl', DEFAULT_RESOLUTION_CACHE_TTL)
+        if ttl:
+            path = profile_file(RESOLUTION_CACHE_PATH,
+                                ctx.obj['profiles'].name)
+            cache = PersistentResolutionCache(path=path, ttl=ttl)
+            ctx.obj['resolution_cache'] = cache
+    return cache
+
+
+def resolve_href(ctx, key, resolver):
+    """Resolve the href of an entity, through the cache if there is one.
+
+    :param click.Context ctx: the click context, whose object may hold a
+        ResolutionCache under 'resolution_cache'.
+    :param tuple key: cache key of the entity.
+    :param function resolver: function without parameters returning the
+        href of the entity from vCD, called on a cache miss.
+
+    :return: href of the entity.
+
+    :rtype: str
+    """
+    cache = get_resolution_cache(ctx)
+    if cache is None:
+        return resolver()
+    href = cache.get(key)
+    if href is None:
+        resolved = time.time()
+        href = resolver()
+        cache.put(key, href, resolved)
+    return href
+
+
+def resolve_resource(ctx, key, resolver):
+    """Resolve an entity through the cache and fetch its resource.
+
+    A cached href that is no longer found in vCD, e.g. because the entity
+    was deleted or moved by someone else, is dropped from the cache and the
+    entity is resolved again.
+
+    :param click.Context ctx: the click context.
+    :param tuple key: cache key of the entity.
+    :param function resolver: function without parameters returning the
+        href of the entity from vCD, called on a cache miss.
+
+    :return: the resource of the entity.
+
+    :rtype: lxml.objectify.ObjectifiedElement
+    """
+    client = ctx.obj['client']
+    cache = get_resolution_cache(ctx)
+    cached = cache is not None and cache.get(key) is not None
+    try:
+        return client.get_resource(resolve_href(ctx, key, resolver))
+    except (NotFoundException, AccessForbiddenException):
+        if not cached:
+            raise
+    cache.invalidate(key)
+    return client.get_resource(resolve_href(ctx, key, resolver))
+
+
+def invalidate(ctx, *prefix):
+    """Drop the cached resolutions of an entity and of its children.
+
+    To be called by commands that delete, rename or move an entity, e.g.
+    invalidate(ctx, 'vapp', vdc_href, name) after deleting a vApp.
+    """
+    cache = get_resolution_cache(ctx)
+    if cache is not None:
+        cache.invalidate(prefix)
+        if prefix[0] == 'vapp':
+            cache.invalidate(('vm', ) + prefix[1:])
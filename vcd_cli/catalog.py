@@ -13,7 +13,6 @@
 import os
 
 import click
-from pyvcloud.vcd.client import QueryResultFormat
 from pyvcloud.vcd.client import ResourceType
 from pyvcloud.vcd.exceptions import AccessForbiddenException
 from pyvcloud.vcd.org import Org
@@ -22,10 +21,12 @@ from pyvcloud.vcd.utils import to_dict
 from pyvcloud.vcd.utils import vapp_to_dict
 from pyvcloud.vcd.vapp import VApp
 
+from vcd_cli.query import execute_query
 from vcd_cli.utils import access_settings_to_list
 from vcd_cli.utils import acl_str_to_list_of_dict
 from vcd_cli.utils import is_sysadmin
 from vcd_cli.utils import restore_session
+from vcd_cli.utils import split_fields
 from vcd_cli.utils import stderr
 from vcd_cli.utils import stdout
 from vcd_cli.utils import task_callback
@@ -162,7 +163,13 @@ def update(ctx, catalog_name, new_catalog_name, description):
 @catalog.command('list', short_help='list catalogs or items')
 @click.pass_context
 @click.argument('catalog-name', metavar='[catalog-name]', required=False)
-def list_catalogs_or_items(ctx, catalog_name):
+@click.option(
+    '--fields',
+    metavar='<attr,...>',
+    callback=split_fields,
+    default=None,
+    help='Comma separated attributes of the items to fetch and show')
+def list_catalogs_or_items(ctx, catalog_name, fields):
     try:
         restore_session(ctx)
         client = ctx.obj['client']
@@ -176,16 +183,20 @@ def list_catalogs_or_items(ctx, catalog_name):
                 resource_type = ResourceType.ADMIN_CATALOG_ITEM.value
             else:
                 resource_type = ResourceType.CATALOG_ITEM.value
-            q = client.get_typed_query(
-                resource_type,
-                query_result_format=QueryResultFormat.ID_RECORDS,
-                equality_filter=('catalogName', catalog_name))
-            records = list(q.execute())
+            records = list(
+                execute_query(
+                    client,
+                    resource_type,
+                    equality_filter=('catalogName', catalog_name),
+                    fields=fields))
             if len(records) == 0:
                 result = 'not found'
-            else:
+            elif fields is None:
                 for r in records:
                     result.append(to_dict(r, resource_type=resource_type))
+            else:
+                for r in records:
+                    result.append(to_dict(r, attributes=fields))
         stdout(result, ctx)
     except Exception as e:
         stderr(e, ctx)
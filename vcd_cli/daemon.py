@@ -0,0 +1,323 @@
+# vCloud CLI 0.1
+#
+# Copyright (c) 2014-2018 VMware, Inc. All Rights Reserved.
+#
+# This product is licensed to you under the
+# Apache License, Version 2.0 (the "License").
+# You may not use this product except in compliance with the License.
+#
+# This product may include a number of subcomponents with
+# separate copyright notices and license terms. Your use of the source
+# code for the these subcomponents is subject to the terms and
+# conditions of the subcomponent's license, as noted in the LICENSE file.
+#
+
+import io
+import json
+import os
+import socket
+import socketserver
+import sys
+import threading
+import time
+
+import click
+
+from vcd_cli.daemon_client import call
+from vcd_cli.daemon_client import DAEMON_SOCKET_PATH
+from vcd_cli.daemon_client import DAEMON_TIMEOUT
+from vcd_cli.profiles import Profiles
+from vcd_cli.runner import run_command
+from vcd_cli.utils import create_client
+from vcd_cli.utils import stderr
+from vcd_cli.utils import stdout
+from vcd_cli.vcd import vcd
+
+
+@vcd.group(short_help='manage the session daemon')
+@click.pass_context
+def daemon(ctx):
+    """Manage the vcd-cli session daemon.
+
+\b
+    Description
+        The session daemon keeps an authenticated client per profile, with
+        its pool of keep-alive HTTPS connections, and runs the vcd commands
+        forwarded to it over a Unix socket. While the daemon is running,
+        vcd forwards every command except 'login', 'shell' and 'daemon' to
+        it, so sequences of commands pay for the TLS handshake, API version
+        negotiation and session lookup only once.
+\b
+        Commands are run one at a time, in the working directory and with
+        the VCD_* environment variables of the invoking process. A command
+        forwarded while another one is running, or that the daemon doesn't
+        take within 5 seconds, runs in the invoking process instead.
+        Commands can't read from the terminal: confirmation prompts are
+        aborted, use --yes instead. Command lines with a '-' argument run
+        locally.
+\b
+    Examples
+        vcd daemon start
+            Start the session daemon in the background.
+\b
+        vcd daemon status
+            Show the state of the session daemon.
+\b
+        vcd daemon stop
+            Stop the session daemon.
+\b
+    Environment Variables
+        VCD_USE_DAEMON
+            If this environment variable is set to '0', commands run in the
+            invoking process even when the daemon is running.
+\b
+    Files
+        ~/.vcd-cli/daemon.sock
+            The socket the daemon listens on, only accessible to the user.
+    """
+    pass
+
+
+class MessageStream(io.TextIOBase):
+    """Text stream that relays what is written to it as reply messages.
+
+    Once the front end goes away, output is dropped so that the command
+    still runs to completion.
+    """
+
+    encoding = 'utf-8'
+    errors = 'strict'
+
+    def __init__(self, wfile, key, tty=False):
+        self.wfile = wfile
+        self.key = key
+        self.tty = tty
+        self.broken = False
+
+    def write(self, text):
+        if not isinstance(text, str):
+            raise TypeError('write() argument must be str')
+        if not self.broken and len(text) > 0:
+            try:
+                self.wfile.write((json.dumps({
+                    self.key: text
+                }) + '\n').encode('utf-8'))
+                self.wfile.flush()
+            except Exception:
+                self.broken = True
+        return len(text)
+
+    def isatty(self):
+        return self.tty
+
+
+class SessionRequestHandler(socketserver.StreamRequestHandler):
+    # Seconds a front end has to send its request.
+    timeout = DAEMON_TIMEOUT
+
+    def handle(self):
+        request = json.loads(self.rfile.readline().decode('utf-8'))
+        # commands may run, and print, for as long as they need
+        self.connection.settimeout(None)
+        command = request.get('command', 'run')
+        if command == 'stop':
+            self.server.stopping = True
+            self.send({'exit_code': 0})
+        elif command == 'status':
+            self.send({'status': self.server.status()})
+        elif not self.server.run_lock.acquire(blocking=False):
+            # the front end runs the command itself
+            self.send({'busy': True})
+        else:
+            try:
+                self.send({'accepted': True})
+                try:
+                    exit_code = self.run(request)
+                except Exception as e:
+                    # e.g. the working directory of the front end is gone
+                    self.send({'stderr': 'Error: %s\n' % e})
+                    exit_code = 1
+            finally:
+                self.server.run_lock.release()
+            # only once the daemon is free, the front end may send the next
+            # command right away
+            self.send({'exit_code': exit_code})
+
+    def send(self, message):
+        self.wfile.write((json.dumps(message) + '\n').encode('utf-8'))
+        self.wfile.flush()
+
+    def run(self, request):
+        """Run a forwarded command line with the output sent back."""
+        self.server.requests += 1
+        tty = request.get('tty', False)
+        saved_streams = (sys.stdin, sys.stdout, sys.stderr)
+        saved_cwd = os.getcwd()
+        saved_env = {
+            k: v
+            for k, v in os.environ.items() if k.startswith('VCD_')
+        }
+        try:
+            sys.stdin = io.StringIO()
+            sys.stdout = MessageStream(self.wfile, 'stdout', tty)
+            sys.stderr = MessageStream(self.wfile, 'stderr', tty)
+            os.chdir(request.get('cwd', saved_cwd))
+            self.set_env(request.get('env', {}))
+            # the profile selected by --profile or VCD_PROFILE
+            root = vcd.root_context(request['args'])
+            name = root.params.get('profile') if root is not None else None
+            try:
+                profiles = Profiles.load(name=name)
+                obj = {
+                    'client': self.server.get_client(
+                        profiles, profiles.name),
+                    'profiles': profiles
+                }
+            except Exception:
+                # let the command report why the session can't be restored
+                obj = None
+            return run_command(request['args'], obj)
+        finally:
+            sys.stdin, sys.stdout, sys.stderr = saved_streams
+            os.chdir(saved_cwd)
+            self.set_env(saved_env)
+
+    @staticmethod
+    def set_env(env):
+        for k in [k for k in os.environ.keys() if k.startswith('VCD_')]:
+            if k not in env:
+                del os.environ[k]
+        os.environ.update(env)
+
+
+class SessionServer(socketserver.ThreadingMixIn,
+                    socketserver.UnixStreamServer):
+    """Unix socket server holding one authenticated client per profile.
+
+    Clients are created from the token saved in the profile and replaced
+    when the token changes, e.g. after a new login, so the daemon follows
+    the profiles file like any other vcd process.
+
+    Each connection is served by a thread of its own, so status and stop
+    requests are answered while a command runs. Commands change the
+    standard streams, working directory and environment of the process
+    and are run one at a time; the ones sent meanwhile are turned down.
+    """
+
+    request_queue_size = 64
+    # Seconds between checks for a stop request.
+    timeout = 0.5
+
+    def __init__(self, path=DAEMON_SOCKET_PATH):
+        self.path = os.path.expanduser(path)
+        parent_dir = os.path.dirname(self.path)
+        if not os.path.exists(parent_dir):
+            os.makedirs(parent_dir)
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        old_umask = os.umask(0o077)
+        try:
+            socketserver.UnixStreamServer.__init__(self, self.path,
+                                                   SessionRequestHandler)
+        finally:
+            os.umask(old_umask)
+        self.clients = {}
+        self.run_lock = threading.Lock()
+        self.requests = 0
+        self.started = time.time()
+        self.stopping = False
+
+    def get_client(self, profiles, name='default'):
+        token = profiles.get('token', name)
+        if name in self.clients and self.clients[name][0] == token:
+            return self.clients[name][1]
+        client = create_client(profiles)
+        self.clients[name] = (token, client)
+        return client
+
+    def status(self):
+        return {
+            'pid': os.getpid(),
+            'socket': self.path,
+            'uptime': int(time.time() - self.started),
+            'requests': self.requests,
+            'profiles': ', '.join(sorted(self.clients.keys()))
+        }
+
+    def serve(self):
+        try:
+            while not self.stopping:
+                self.handle_request()
+        finally:
+            self.server_close()
+            if os.path.exists(self.path):
+                os.unlink(self.path)
+
+
+def is_running(path=DAEMON_SOCKET_PATH):
+    try:
+        return call({'command': 'status'}, path) is not None
+    except Exception:
+        return False
+
+
+@daemon.command(short_help='start the session daemon')
+@click.pass_context
+@click.option(
+    '-f',
+    '--foreground',
+    is_flag=True,
+    default=False,
+    help='Run in the foreground instead of detaching')
+def start(ctx, foreground):
+    try:
+        if not hasattr(socket, 'AF_UNIX'):
+            raise Exception('The session daemon requires Unix sockets.')
+        if is_running():
+            raise Exception('The session daemon is already running.')
+        server = SessionServer()
+        if not foreground:
+            pid = os.fork()
+            if pid > 0:
+                server.socket.close()
+                stdout({
+                    'pid': pid,
+                    'socket': server.path
+                }, ctx, 'session daemon started, pid: %s' % pid)
+                return
+            os.setsid()
+            devnull = os.open(os.devnull, os.O_RDWR)
+            for fd in range(3):
+                os.dup2(devnull, fd)
+            server.serve()
+            os._exit(0)
+        click.secho('session daemon listening on %s' % server.path)
+        try:
+            server.serve()
+        except KeyboardInterrupt:
+            pass
+    except Exception as e:
+        stderr(e, ctx)
+
+
+@daemon.command(short_help='stop the session daemon')
+@click.pass_context
+def stop(ctx):
+    try:
+        if not is_running():
+            raise Exception('The session daemon is not running.')
+        call({'command': 'stop'})
+        stdout('session daemon stopped.', ctx)
+    except Exception as e:
+        stderr(e, ctx)
+
+
+@daemon.command(short_help='show session daemon status')
+@click.pass_context
+def status(ctx):
+    try:
+        if not is_running():
+            raise Exception('The session daemon is not running.')
+        stdout(call({'command': 'status'})['status'], ctx)
+    except Exception as e:
+        stderr(e, ctx)
@@ -0,0 +1,139 @@
+# vCloud CLI 0.1
+#
+# Copyright (c) 2014-2018 VMware, Inc. All Rights Reserved.
+#
+# This product is licensed to you under the
+# Apache License, Version 2.0 (the "License").
+# You may not use this product except in compliance with the License.
+#
+# This product may include a number of subcomponents with
+# separate copyright notices and license terms. Your use of the source
+# code for the these subcomponents is subject to the terms and
+# conditions of the subcomponent's license, as noted in the LICENSE file.
+#
+
+import json
+import os
+import socket
+import sys
+
+from vcd_cli.profiles import VCD_CLI_USER_PATH
+
+DAEMON_SOCKET_PATH = VCD_CLI_USER_PATH + '/daemon.sock'
+
+# Seconds to wait for the daemon to answer a connection or take a command.
+DAEMON_TIMEOUT = 5
+
+# Commands never forwarded to the daemon: the daemon commands themselves
+# and the commands that need the terminal of the user.
+LOCAL_COMMANDS = ['daemon', 'login', 'shell']
+
+
+def connect(path=DAEMON_SOCKET_PATH, timeout=DAEMON_TIMEOUT):
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.settimeout(timeout)
+        sock.connect(os.path.expanduser(path))
+    except Exception:
+        sock.close()
+        raise
+    return sock
+
+
+def send_request(sock, request):
+    """Send a request to the daemon and yield the messages of its reply.
+
+    :param socket.socket sock: socket connected to the daemon.
+    :param dict request: the request, serialized as one line of JSON.
+
+    :return: a generator of the reply messages, one dict per JSON line.
+    """
+    sock.sendall((json.dumps(request) + '\n').encode('utf-8'))
+    with sock.makefile('r', encoding='utf-8') as f:
+        for line in f:
+            yield json.loads(line)
+
+
+def call(request, path=DAEMON_SOCKET_PATH):
+    """Send a control request to the daemon and return its last message."""
+    sock = connect(path)
+    try:
+        message = None
+        for message in send_request(sock, request):
+            pass
+        return message
+    finally:
+        sock.close()
+
+
+def should_forward(command, args, path=DAEMON_SOCKET_PATH):
+    """Tell whether a command line should be run by the session daemon.
+
+    Commands are forwarded when the daemon socket exists, unless the
+    environment variable VCD_USE_DAEMON is '0', the command must run
+    locally, or an argument is '-' (the daemon can't read our stdin).
+
+    :param str command: name of the top level command, as returned by
+        LazyGroup.command_name().
+    :param list args: command line arguments, without the leading 'vcd'.
+    :param str path: location of the daemon socket.
+
+    :rtype: bool
+    """
+    if not hasattr(socket, 'AF_UNIX') or \
+            os.environ.get('VCD_USE_DAEMON') == '0':
+        return False
+    if '-' in args or not os.path.exists(os.path.expanduser(path)):
+        return False
+    return command is not None and command not in LOCAL_COMMANDS
+
+
+def forward(args, path=DAEMON_SOCKET_PATH):
+    """Run a command line in the session daemon, relaying its output.
+
+    :param list args: command line arguments, without the leading 'vcd'.
+    :param str path: location of the daemon socket.
+
+    :return: exit code of the command, or None if the daemon could not be
+        reached, is busy or did not take the command in time, and the
+        command should run locally.
+
+    :rtype: int
+    """
+    try:
+        sock = connect(path)
+    except Exception:
+        return None
+    request = {
+        'args': args,
+        'cwd': os.getcwd(),
+        'env': {k: v
+                for k, v in os.environ.items() if k.startswith('VCD_')},
+        'tty': sys.stdout.isatty()
+    }
+    exit_code = 1
+    try:
+        messages = send_request(sock, request)
+        try:
+            reply = next(messages)
+        except Exception:
+            # the daemon went away, or is stuck, before taking the command
+            return None
+        if reply.get('busy'):
+            return None
+        # the command may run for as long as it needs
+        sock.settimeout(None)
+        for message in messages:
+            if 'stdout' in message:
+                sys.stdout.write(message['stdout'])
+                sys.stdout.flush()
+            elif 'stderr' in message:
+                sys.stderr.write(message['stderr'])
+                sys.stderr.flush()
+            elif 'exit_code' in message:
+                exit_code = message['exit_code']
+    except Exception as e:
+        sys.stderr.write('Lost connection to the vcd daemon: %s\n' % e)
+    finally:
+        sock.close()
+    return exit_code
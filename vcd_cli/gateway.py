@@ -16,13 +16,16 @@ import click
 from pyvcloud.vcd.client import ApiVersion
 from pyvcloud.vcd.client import EdgeGatewayType
 from pyvcloud.vcd.client import GatewayBackingConfigType
+from pyvcloud.vcd.gateway import Gateway
 from pyvcloud.vcd.vdc import VDC
+
+from vcd_cli.cache import invalidate
+from vcd_cli.cache import resolve_resource
 from vcd_cli.utils import restore_session
 from vcd_cli.utils import stderr
 from vcd_cli.utils import stdout
-from vcd_cli.vcd import vcd
-from pyvcloud.vcd.gateway import Gateway
 from vcd_cli.utils import tuple_to_dict
+from vcd_cli.vcd import vcd
 
 
 @vcd.group(short_help='manage edge gateways')
@@ -336,6 +339,7 @@ def delete_gateway(ctx, name):
         vdc_href = ctx.obj['profiles'].get('vdc_href')
         vdc = VDC(client, href=vdc_href)
         task = vdc.delete_gateway(name)
+        invalidate(ctx, 'gateway', vdc_href, name)
         stdout(task, ctx)
     except Exception as e:
         stderr(e, ctx)
@@ -410,9 +414,11 @@ def get_gateway(ctx, name):
     restore_session(ctx, vdc_required=True)
     client = ctx.obj['client']
     vdc_href = ctx.obj['profiles'].get('vdc_href')
-    vdc = VDC(client, href=vdc_href)
-    gateway = vdc.get_gateway(name)
-    gateway_resource = Gateway(client, href=gateway.get('href'))
+    gateway_resource = Gateway(
+        client,
+        resource=resolve_resource(
+            ctx, ('gateway', vdc_href, name),
+            lambda: VDC(client, href=vdc_href).get_gateway(name).get('href')))
     return gateway_resource
 
 
@@ -585,6 +591,9 @@ def edit_gateway(ctx, name, new_name, desc, is_enabled):
     try:
         gateway_resource = get_gateway(ctx, name)
         task = gateway_resource.edit_gateway(new_name, desc, is_enabled)
+        if new_name is not None:
+            invalidate(ctx, 'gateway', ctx.obj['profiles'].get('vdc_href'),
+                       name)
         stdout(task, ctx)
     except Exception as e:
         stderr(e, ctx)
@@ -0,0 +1,572 @@
+# vCloud CLI 0.1
+#
+# Copyright (c) 2014-2018 VMware, Inc. All Rights Reserved.
+#
+# This product is licensed to you under the
+# Apache License, Version 2.0 (the "License").
+# You may not use this product except in compliance with the License.
+#
+# This product may include a number of subcomponents with
+# separate copyright notices and license terms. Your use of the source
+# code for the these subcomponents is subject to the terms and
+# conditions of the subcomponent's license, as noted in the LICENSE file.
+#
+
+import collections
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import time
+
+import click
+from pyvcloud.vcd.client import QueryResultFormat
+from pyvcloud.vcd.client import ResourceType
+from pyvcloud.vcd.utils import extract_id
+from pyvcloud.vcd.utils import filter_attributes
+from pyvcloud.vcd.utils import to_dict
+
+from vcd_cli.profiles import profile_file
+from vcd_cli.profiles import profile_name
+from vcd_cli.profiles import VCD_CLI_USER_PATH
+from vcd_cli.utils import as_metavar
+from vcd_cli.utils import restore_session
+from vcd_cli.utils import stderr
+from vcd_cli.utils import stdout
+from vcd_cli.vcd import vcd
+
+LOGGER = logging.getLogger(__name__)
+
+INVENTORY_PATH = VCD_CLI_USER_PATH + '/inventory.db'
+
+# Kinds of entities kept in the inventory, with the query resource types
+# used by organization users and by the system administrator, and the
+# query filter applied.
+INVENTORY_TYPES = collections.OrderedDict([
+    ('org', (ResourceType.ORGANIZATION, ResourceType.ORGANIZATION, None)),
+    ('vdc', (ResourceType.ORG_VDC, ResourceType.ADMIN_ORG_VDC, None)),
+    ('vapp', (ResourceType.VAPP, ResourceType.ADMIN_VAPP, None)),
+    ('vm', (ResourceType.VM, ResourceType.ADMIN_VM, 'isVAppTemplate==false')),
+    ('disk', (ResourceType.DISK, ResourceType.ADMIN_DISK, None)),
+    ('network', (ResourceType.ORG_VDC_NETWORK, ResourceType.ORG_VDC_NETWORK,
+                 None)),
+    ('gateway', (ResourceType.EDGE_GATEWAY, ResourceType.EDGE_GATEWAY, None)),
+    ('catalog-item', (ResourceType.CATALOG_ITEM,
+                      ResourceType.ADMIN_CATALOG_ITEM, None)),
+])
+
+# Entity types found in the ids and hrefs of audit events, by kind.
+EVENT_ENTITY_TYPES = {
+    'org': 'org',
+    'vdc': 'vdc',
+    'vapp': 'vapp',
+    'vm': 'vm',
+    'disk': 'disk',
+    'network': 'network',
+    'gateway': 'gateway',
+    'edgegateway': 'gateway',
+    'catalogitem': 'catalog-item',
+}
+
+# Number of records fetched per query page.
+QUERY_PAGE_SIZE = 128
+
+# Number of entity kinds fetched at a time.
+SYNC_WORKERS = 4
+
+# Maximum number of ids filtered on in one query.
+ID_BATCH_SIZE = 25
+
+# Above this number of changed entities of a kind, all of its records are
+# fetched again rather than the changed ones.
+INCREMENTAL_LIMIT = 500
+
+# Seconds the events looked at overlap the previous sync, to allow for
+# clock differences between the client and vCD.
+EVENT_OVERLAP = 120
+
+SCHEMA_VERSION = 2
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT);
+CREATE TABLE IF NOT EXISTS sync (
+    kind TEXT PRIMARY KEY,
+    resource_type TEXT NOT NULL,
+    synced_at REAL NOT NULL,
+    count INTEGER NOT NULL);
+CREATE TABLE IF NOT EXISTS record (
+    kind TEXT NOT NULL,
+    id TEXT NOT NULL,
+    href TEXT,
+    name TEXT,
+    vdc TEXT,
+    vdc_href TEXT,
+    org TEXT,
+    hash TEXT NOT NULL,
+    data TEXT NOT NULL,
+    PRIMARY KEY (kind, id));
+CREATE INDEX IF NOT EXISTS record_name ON record (kind, name);
+CREATE INDEX IF NOT EXISTS record_vdc ON record (kind, vdc);
+CREATE INDEX IF NOT EXISTS record_vdc_href ON record (kind, vdc_href);
+CREATE INDEX IF NOT EXISTS record_org ON record (kind, org);
+'''
+
+
+class Inventory(object):
+    """Local SQLite snapshot of the entities visible to a session.
+
+    Records are stored as returned by typed queries, one row per entity
+    with its name, vDC and organization indexed and a hash of its
+    attributes, and the snapshot belongs to one host, organization and
+    user: syncing it for another session starts it over.
+    """
+
+    def __init__(self, path=INVENTORY_PATH):
+        path = os.path.expanduser(path)
+        parent_dir = os.path.dirname(path)
+        if not os.path.exists(parent_dir):
+            os.makedirs(parent_dir)
+        self.conn = sqlite3.connect(path)
+        version = self.conn.execute('PRAGMA user_version').fetchone()[0]
+        if version != SCHEMA_VERSION:
+            with self.conn:
+                for table in ['meta', 'sync', 'record']:
+                    self.conn.execute('DROP TABLE IF EXISTS %s' % table)
+        self.conn.executescript(SCHEMA)
+        self.conn.execute('PRAGMA user_version = %d' % SCHEMA_VERSION)
+
+    def close(self):
+        self.conn.close()
+
+    def get_meta(self, key):
+        row = self.conn.execute('SELECT value FROM meta WHERE key = ?',
+                                (key, )).fetchone()
+        return row[0] if row is not None else None
+
+    def set_owner(self, owner):
+        """Start the snapshot over unless it belongs to the given session.
+
+        :param str owner: identifies the session, e.g. 'user@org@host'.
+        """
+        if self.get_meta('owner') == owner:
+            return
+        with self.conn:
+            self.conn.execute('DELETE FROM record')
+            self.conn.execute('DELETE FROM sync')
+            self.conn.execute(
+                'INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)',
+                ('owner', owner))
+
+    def hashes(self, kind, ids=None):
+        """Return the hashes of the stored records of a kind, by id."""
+        rows = self.conn.execute('SELECT id, hash FROM record WHERE kind = ?',
+                                 (kind, ))
+        return {i: h for i, h in rows if ids is None or i in ids}
+
+    def merge(self, kind, resource_type, records, ids=None, synced_at=None):
+        """Store the records of a kind of entity, in one transaction.
+
+        Only the records whose attributes changed are written. Stored
+        records missing from the given ones are deleted: all of them, or
+        only those among the given ids when a subset was fetched.
+
+        :param str kind: one of INVENTORY_TYPES.
+        :param str resource_type: query resource type of the records.
+        :param list records: the query records.
+        :param set ids: ids of the entities the records were fetched for,
+            or None if all the records of the kind were fetched.
+        :param float synced_at: time the fetch started.
+
+        :return: the number of records added, changed and removed.
+
+        :rtype: tuple
+        """
+        old = self.hashes(kind, ids)
+        rows = [record_row(kind, r) for r in records]
+        new = [row for row in rows if old.get(row[1]) != row[7]]
+        seen = set(row[1] for row in rows)
+        removed = [(kind, i) for i in old if i not in seen]
+        with self.conn:
+            self.conn.executemany(
+                'INSERT OR REPLACE INTO record '
+                '(kind, id, href, name, vdc, vdc_href, org, hash, data) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)', new)
+            self.conn.executemany(
+                'DELETE FROM record WHERE kind = ? AND id = ?', removed)
+            count = self.conn.execute(
+                'SELECT COUNT(*) FROM record WHERE kind = ?',
+                (kind, )).fetchone()[0]
+            self.conn.execute(
+                'INSERT OR REPLACE INTO sync '
+                '(kind, resource_type, synced_at, count) '
+                'VALUES (?, ?, ?, ?)',
+                (kind, resource_type, synced_at or time.time(), count))
+        added = len([row for row in new if row[1] not in old])
+        return added, len(new) - added, len(removed)
+
+    def query(self,
+              kind,
+              name=None,
+              vdc=None,
+              org=None,
+              filters=(),
+              vdc_href=None):
+        """Find records of a kind of entity.
+
+        :param str kind: one of INVENTORY_TYPES.
+        :param str name: glob pattern the name has to match.
+        :param str vdc: name of the vDC of the entities.
+        :param str org: name of the organization of the entities.
+        :param list filters: (attribute, value) tuples the records have to
+            match.
+        :param str vdc_href: href of the vDC of the entities.
+
+        :return: the records as dicts, sorted by name.
+
+        :rtype: list
+        """
+        sql = 'SELECT data FROM record WHERE kind = ?'
+        params = [kind]
+        if name is not None:
+            sql += ' AND name GLOB ?'
+            params.append(name)
+        if vdc is not None:
+            sql += ' AND vdc = ?'
+            params.append(vdc)
+        if vdc_href is not None:
+            sql += ' AND vdc_href = ?'
+            params.append(vdc_href)
+        if org is not None:
+            sql += ' AND org = ?'
+            params.append(org)
+        for attribute, value in filters:
+            sql += ' AND CAST(json_extract(data, ?) AS TEXT) = ?'
+            params.extend(['$."%s"' % attribute, value])
+        sql += ' ORDER BY name'
+        return [json.loads(row[0]) for row in self.conn.execute(sql, params)]
+
+    def get(self, kind, ids):
+        """Return the stored records of a kind with the given ids."""
+        ids = list(ids)
+        records = []
+        for n in range(0, len(ids), ID_BATCH_SIZE):
+            batch = ids[n:n + ID_BATCH_SIZE]
+            records.extend(
+                json.loads(row[0]) for row in self.conn.execute(
+                    'SELECT data FROM record WHERE kind = ? AND id IN (%s)' %
+                    ','.join('?' * len(batch)), [kind] + batch))
+        return records
+
+    def sync_state(self, kind):
+        """Return the resource type, time and count of the last sync."""
+        return self.conn.execute(
+            'SELECT resource_type, synced_at, count FROM sync '
+            'WHERE kind = ?', (kind, )).fetchone()
+
+
+def record_row(kind, record):
+    data = to_dict(record)
+    data['id'] = extract_id(record.get('id') or record.get('href'))
+    name = data.get('name')
+    text = json.dumps(data, sort_keys=True)
+    return (kind, data['id'], record.get('href'), name,
+            name if kind == 'vdc' else data.get('vdcName'),
+            record.get('href') if kind == 'vdc' else record.get('vdc'),
+            name if kind == 'org' else data.get('orgName'),
+            hashlib.sha1(text.encode('utf-8')).hexdigest(), text)
+
+
+def query_resource_type(client, kind):
+    org_type, admin_type, qfilter = INVENTORY_TYPES[kind]
+    return (admin_type if client.is_sysadmin() else org_type).value, qfilter
+
+
+def fetch_records(client, kind):
+    """Fetch all the records of a kind of entity with a paged query.
+
+    :return: the records.
+
+    :rtype: list
+    """
+    resource_type, qfilter = query_resource_type(client, kind)
+    query = client.get_typed_query(
+        resource_type,
+        query_result_format=QueryResultFormat.ID_RECORDS,
+        page_size=QUERY_PAGE_SIZE,
+        qfilter=qfilter)
+    return list(query.execute())
+
+
+def fetch_records_by_id(client, kind, ids):
+    """Fetch the records of the entities of a kind with the given ids."""
+    resource_type, qfilter = query_resource_type(client, kind)
+    urn_type = kind.replace('-', '')
+    ids = sorted(ids)
+    records = []
+    for n in range(0, len(ids), ID_BATCH_SIZE):
+        query = client.get_typed_query(
+            resource_type,
+            query_result_format=QueryResultFormat.ID_RECORDS,
+            page_size=ID_BATCH_SIZE,
+            qfilter=','.join('id==urn:vcloud:%s:%s' % (urn_type, i)
+                             for i in ids[n:n + ID_BATCH_SIZE]))
+        records.extend(query.execute())
+    if qfilter == 'isVAppTemplate==false':
+        records = [r for r in records if r.get('isVAppTemplate') != 'true']
+    return records
+
+
+def event_entity(entity):
+    """Return the kind and id of the entity of an audit event, or None.
+
+    :param str entity: urn or href of the entity, e.g.
+        'urn:vcloud:vm:<id>' or 'https://<host>/api/vApp/vm-<id>'.
+    """
+    if entity is None:
+        return None
+    if entity.startswith('urn:'):
+        parts = entity.split(':')
+        entity_type, entity_id = parts[-2], parts[-1]
+    else:
+        parts = entity.rstrip('/').split('/')
+        entity_type, entity_id = parts[-2], parts[-1]
+        for prefix in ['vm-', 'vapp-']:
+            if entity_id.startswith(prefix):
+                entity_type, entity_id = prefix[:-1], entity_id[len(prefix):]
+    kind = EVENT_ENTITY_TYPES.get(entity_type.lower())
+    return (kind, entity_id) if kind is not None else None
+
+
+def changed_entities(client, since):
+    """Find the entities with audit events since a given time.
+
+    :param float since: time in seconds since the epoch.
+
+    :return: the ids of the changed entities, by kind.
+
+    :rtype: dict
+    """
+    resource_type = ResourceType.ADMIN_EVENT.value if client.is_sysadmin() \
+        else ResourceType.EVENT.value
+    query = client.get_typed_query(
+        resource_type,
+        query_result_format=QueryResultFormat.ID_RECORDS,
+        page_size=QUERY_PAGE_SIZE,
+        qfilter='timeStamp=ge=%s' % time.strftime(
+            '%Y-%m-%dT%H:%M:%S.000Z', time.gmtime(since)))
+    changed = collections.defaultdict(set)
+    for event in query.execute():
+        found = event_entity(event.get('entity'))
+        if found is not None:
+            changed[found[0]].add(found[1])
+    return changed
+
+
+def sync_kinds(client, inv, kinds, full=False):
+    """Bring the records of kinds of entities in the snapshot up to date.
+
+    Kinds synced before are updated from the audit events since their last
+    sync: only the entities with events are fetched again, and the vApps
+    of changed VMs. Kinds never synced, or with too many changes, are
+    fetched entirely and compared with the snapshot by record hash, as are
+    all kinds if the events can't be queried or full is set.
+
+    :param pyvcloud.vcd.client.Client client: the client to query with.
+    :param Inventory inv: the snapshot.
+    :param list kinds: kinds of entities, from INVENTORY_TYPES.
+    :param bool full: fetch all the records of every kind.
+
+    :return: a summary dict per kind.
+
+    :rtype: list
+    """
+    start = time.time()
+    states = {kind: inv.sync_state(kind) for kind in kinds}
+    synced = [kind for kind in kinds if states[kind] is not None]
+    changed = None
+    if not full and len(synced) > 0:
+        since = min(states[kind][1] for kind in synced) - EVENT_OVERLAP
+        try:
+            changed = changed_entities(client, since)
+        except Exception as e:
+            LOGGER.warning('Inventory events not available: %s' % e)
+    if changed is not None and 'vapp' in kinds:
+        for vm in inv.get('vm', changed['vm']):
+            vapp = event_entity(vm.get('container'))
+            if vapp is not None:
+                changed['vapp'].add(vapp[1])
+
+    def fetch(kind):
+        resource_type = query_resource_type(client, kind)[0]
+        if changed is None or states[kind] is None or \
+                len(changed[kind]) > INCREMENTAL_LIMIT:
+            return 'full', resource_type, fetch_records(client, kind), None
+        ids = changed[kind]
+        return 'events', resource_type, \
+            fetch_records_by_id(client, kind, ids), ids
+
+    result = []
+    with ThreadPoolExecutor(max_workers=SYNC_WORKERS) as executor:
+        for kind, (mode, resource_type, records, ids) in zip(
+                kinds, executor.map(fetch, kinds)):
+            added, updated, removed = inv.merge(kind, resource_type, records,
+                                                ids, start)
+            result.append({
+                'kind': kind,
+                'mode': mode,
+                'fetched': len(records),
+                'added': added,
+                'changed': updated,
+                'removed': removed,
+                'records': inv.sync_state(kind)[2]
+            })
+    return result
+
+
+def snapshot_records(ctx, kind, **query):
+    """Serve records of a kind of entity from the synced snapshot.
+
+    The snapshot is first brought up to date with sync_kinds(), so this
+    costs the queries of the changes only, once the kind has been synced.
+
+    :param click.Context ctx: the click context, with a restored session.
+    :param str kind: one of INVENTORY_TYPES.
+    :param dict query: criteria passed to Inventory.query().
+
+    :return: the query resource type and the records as dicts.
+
+    :rtype: tuple
+    """
+    inv = Inventory(inventory_path(ctx))
+    try:
+        inv.set_owner(session_owner(ctx.obj['profiles']))
+        sync_kinds(ctx.obj['client'], inv, [kind])
+        return inv.sync_state(kind)[0], inv.query(kind, **query)
+    finally:
+        inv.close()
+
+
+def inventory_path(ctx):
+    """Get the path of the inventory of the profile of the command."""
+    return profile_file(INVENTORY_PATH, profile_name(ctx))
+
+
+def session_owner(profiles):
+    return '%s@%s@%s' % (profiles.get('user'), profiles.get('org'),
+                         profiles.get('host'))
+
+
+@vcd.group(short_help='work with the local inventory snapshot')
+@click.pass_context
+def inventory(ctx):
+    """Work with the local inventory snapshot.
+
+\b
+    Description
+        The inventory is a snapshot of the entities visible to the current
+        session, kept in a SQLite database in ~/.vcd-cli/inventory.db.
+        'vcd inventory sync' fetches the entities with paged queries and
+        'vcd inventory query' answers from the snapshot, without calls to
+        vCloud Director.
+\b
+        Once a kind of entity is synced, later syncs fetch only the
+        entities changed since, found from the audit events of vCloud
+        Director; when the events can't be queried, all the entities are
+        fetched and compared with the snapshot. 'vcd search' and 'vcd vapp
+        list' serve from the snapshot, after such a sync, with --inventory.
+\b
+        Entity kinds: org, vdc, vapp, vm, disk, network, gateway and
+        catalog-item.
+\b
+    Examples
+        vcd inventory sync
+            Fetch all kinds of entities into the snapshot, or update them.
+\b
+        vcd inventory sync vapp vm
+            Update the vApps and VMs only.
+\b
+        vcd inventory sync --full
+            Fetch all the entities again.
+\b
+        vcd inventory query vm --vdc vdc1 --name 'web*'
+            List the VMs of vdc1 whose name starts with 'web'.
+\b
+        vcd inventory query vapp -f status==POWERED_ON
+            List the vApps that are powered on.
+    """
+    pass
+
+
+@inventory.command(short_help='fetch entities into the snapshot')
+@click.pass_context
+@click.argument(
+    'kinds',
+    metavar=as_metavar(list(INVENTORY_TYPES.keys())),
+    type=click.Choice(list(INVENTORY_TYPES.keys())),
+    nargs=-1)
+@click.option(
+    '--full',
+    is_flag=True,
+    default=False,
+    help='Fetch all the entities instead of the changed ones')
+def sync(ctx, kinds, full):
+    try:
+        restore_session(ctx)
+        client = ctx.obj['client']
+        kinds = kinds or list(INVENTORY_TYPES.keys())
+        inv = Inventory(inventory_path(ctx))
+        try:
+            inv.set_owner(session_owner(ctx.obj['profiles']))
+            result = sync_kinds(client, inv, kinds, full)
+        finally:
+            inv.close()
+        stdout(result, ctx, sort_headers=False)
+    except Exception as e:
+        stderr(e, ctx)
+
+
+@inventory.command(short_help='find entities in the snapshot')
+@click.pass_context
+@click.argument(
+    'kind',
+    metavar=as_metavar(list(INVENTORY_TYPES.keys())),
+    type=click.Choice(list(INVENTORY_TYPES.keys())))
+@click.option(
+    '-n', '--name', metavar='<pattern>', help='Name, \'*\' matches any text')
+@click.option('--vdc', metavar='<vdc-name>', help='Name of the vDC')
+@click.option('--org', metavar='<org-name>', help='Name of the organization')
+@click.option(
+    '-f',
+    '--filter',
+    'filters',
+    metavar='<attribute==value>',
+    multiple=True,
+    help='Attribute value the entities must have, can be repeated')
+def query(ctx, kind, name, vdc, org, filters):
+    try:
+        conditions = []
+        for f in filters:
+            if '==' not in f:
+                raise Exception('filter \'%s\' is not of the form '
+                                'attribute==value' % f)
+            conditions.append(tuple(f.split('==', 1)))
+        inv = Inventory(inventory_path(ctx))
+        try:
+            state = inv.sync_state(kind)
+            if state is None:
+                raise Exception('no %s in the inventory, run \'vcd inventory '
+                                'sync %s\' first' % (kind, kind))
+            records = inv.query(kind, name, vdc, org, conditions)
+        finally:
+            inv.close()
+        attributes = filter_attributes(state[0])
+        if attributes is not None:
+            records = [{k: r.get(k) for k in attributes} for r in records]
+        stdout(records if len(records) > 0 else 'not found', ctx,
+               show_id=True)
+    except Exception as e:
+        stderr(e, ctx)
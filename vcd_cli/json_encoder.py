@@ -0,0 +1,145 @@
+# vCloud CLI 0.1
+#
+# Copyright (c) 2014-2018 VMware, Inc. All Rights Reserved.
+#
+# This product is licensed to you under the
+# Apache License, Version 2.0 (the "License").
+# You may not use this product except in compliance with the License.
+#
+# This product may include a number of subcomponents with
+# separate copyright notices and license terms. Your use of the source
+# code for the these subcomponents is subject to the terms and
+# conditions of the subcomponent's license, as noted in the LICENSE file.
+#
+
+import itertools
+import json
+
+# Pieces of JSON text, as produced by the encoder, joined and written to
+# the output stream at a time.
+WRITE_CHUNK_PIECES = 8192
+
+# Number of items of a list or object from which indented JSON is written
+# in chunks instead of being encoded in one go.
+CHUNKED_MIN_ITEMS = 1000
+
+
+def json_module_encoder(compact, sort_keys):
+    if compact:
+        return json.JSONEncoder(sort_keys=sort_keys, separators=(',', ':'))
+    return json.JSONEncoder(
+        sort_keys=sort_keys, indent=4, separators=(',', ': '))
+
+
+def stdlib_encoder(compact, sort_keys):
+    """Build the encode function of the json module of the standard library.
+
+    Objects are encoded in one go, as json.dumps does: compact output by
+    the C accelerated encoder of the json module, indented output by its
+    pure Python encoder.
+
+    :return: a function turning an object into JSON text.
+
+    :rtype: function
+    """
+    return json_module_encoder(compact, sort_keys).encode
+
+
+def orjson_encoder(compact, sort_keys):
+    """Build the encode function of the orjson package.
+
+    orjson only indents by 2 spaces, so it is only used for compact output
+    unless asked for by name.
+
+    :return: a function turning an object into JSON text.
+
+    :rtype: function
+    """
+    import orjson
+    option = orjson.OPT_NON_STR_KEYS
+    if sort_keys:
+        option |= orjson.OPT_SORT_KEYS
+    if not compact:
+        option |= orjson.OPT_INDENT_2
+
+    def encode(obj):
+        return orjson.dumps(obj, option=option).decode('utf-8')
+
+    return encode
+
+
+# Encoders by name, more can be registered by plugins.
+ENCODERS = {'json': stdlib_encoder, 'orjson': orjson_encoder}
+
+
+def fast_encoder_name():
+    try:
+        import orjson  # NOQA
+        return 'orjson'
+    except ImportError:
+        return 'json'
+
+
+def is_large(obj):
+    return isinstance(obj, (list, tuple, dict)) and \
+        len(obj) >= CHUNKED_MIN_ITEMS
+
+
+class JsonEncoder(object):
+    """Encodes results as JSON with a pluggable encoder.
+
+    By default compact output is encoded by orjson when it is installed
+    (pip install vcd-cli[fast-json]) and by the json module otherwise;
+    indented output is encoded by the json module.
+    """
+
+    def __init__(self, compact=False, sort_keys=True, name=None):
+        """Constructor for JsonEncoder objects.
+
+        :param bool compact: encode without indentation or spaces.
+        :param bool sort_keys: sort the keys of objects.
+        :param str name: name of the encoder in ENCODERS, None to pick the
+            fastest one available.
+        """
+        if name is None:
+            name = fast_encoder_name() if compact else 'json'
+        if name not in ENCODERS:
+            raise Exception('Unknown JSON encoder \'%s\'' % name)
+        self.name = name
+        self.encode = ENCODERS[name](compact, sort_keys)
+        # the json module encodes indented text in pure Python, piece by
+        # piece, even in one go, so writing it in chunks costs nothing more
+        self.iterencode = None
+        if name == 'json' and not compact:
+            self.iterencode = json_module_encoder(compact,
+                                                  sort_keys).iterencode
+
+    def dumps(self, obj):
+        """Encode an object as JSON text.
+
+        :rtype: str
+        """
+        return self.encode(obj)
+
+    def write(self, obj, stream):
+        """Encode an object as JSON text written to a stream.
+
+        Large documents encoded with indentation by the json module are
+        written in chunks as they are encoded, so their text is not held in
+        memory as a whole; anything else is encoded in one go, which is
+        faster.
+
+        :param obj: the object to encode.
+        :param stream: text stream to write to, e.g. sys.stdout.
+        """
+        if self.iterencode is None or not is_large(obj):
+            stream.write(self.encode(obj))
+            stream.flush()
+            return
+        pieces = self.iterencode(obj)
+        while True:
+            chunk = ''.join(itertools.islice(pieces, WRITE_CHUNK_PIECES))
+            if len(chunk) == 0:
+                break
+            stream.write(chunk)
+        stream.flush()
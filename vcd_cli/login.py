@@ -22,6 +22,7 @@ from pyvcloud.vcd.client import get_links
 import requests
 
 from vcd_cli import browsercookie
+from vcd_cli.profiles import profile_name
 from vcd_cli.profiles import Profiles
 from vcd_cli.utils import as_metavar
 from vcd_cli.utils import restore_session
@@ -159,7 +160,7 @@ def login(ctx, user, host, password, api_version, org, verify_ssl_certs,
 
         negotiated_api_version = client.get_api_version()
 
-        profiles = Profiles.load()
+        profiles = Profiles.load(name=profile_name(ctx))
         logged_in_org = client.get_org()
         org_href = logged_in_org.get('href')
         vdc_href = ''
@@ -221,7 +222,7 @@ def login(ctx, user, host, password, api_version, org, verify_ssl_certs,
         stdout(d, ctx, alt_text)
     except Exception as e:
         try:
-            profiles = Profiles.load()
+            profiles = Profiles.load(name=profile_name(ctx))
             profiles.set('token', '')
         except Exception:
             pass
@@ -241,7 +242,7 @@ def logout(ctx):
             client.logout()
         except Exception:
             pass
-        if ctx is not None and ctx.obj is not None:
+        if isinstance(ctx.obj, dict) and 'profiles' in ctx.obj:
             profiles = ctx.obj['profiles']
             profiles.set('token', '')
             stdout('%s logged out.' % (profiles.get('user')), ctx)
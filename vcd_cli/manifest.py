@@ -0,0 +1,203 @@
+# vCloud CLI 0.1
+#
+# Copyright (c) 2014-2018 VMware, Inc. All Rights Reserved.
+#
+# This product is licensed to you under the
+# Apache License, Version 2.0 (the "License").
+# You may not use this product except in compliance with the License.
+#
+# This product may include a number of subcomponents with
+# separate copyright notices and license terms. Your use of the source
+# code for the these subcomponents is subject to the terms and
+# conditions of the subcomponent's license, as noted in the LICENSE file.
+#
+
+import json
+import logging
+import os
+
+import click
+
+from vcd_cli.profiles import Profiles
+from vcd_cli.profiles import VCD_CLI_USER_PATH
+
+LOGGER = logging.getLogger(__name__)
+
+MANIFEST_PATH = VCD_CLI_USER_PATH + '/commands.json'
+
+_manifest = None
+
+
+def installed_version():
+    """Return the version of the installed vcd-cli distribution."""
+    try:
+        from importlib.metadata import version
+        return version('vcd-cli')
+    except ImportError:
+        import pkg_resources
+        return pkg_resources.get_distribution('vcd-cli').version
+
+
+def describe_param(param):
+    """Serialize the parts of a click parameter needed to rebuild it."""
+    entry = {
+        'name': param.name,
+        'kind': 'option' if isinstance(param, click.Option) else 'argument',
+        'opts': list(param.opts),
+        'secondary_opts': list(param.secondary_opts),
+        'nargs': param.nargs,
+        'multiple': param.multiple,
+        'required': param.required,
+        'metavar': param.metavar,
+        'choices': None
+    }
+    if isinstance(param.type, click.Choice):
+        entry['choices'] = list(param.type.choices)
+    if isinstance(param, click.Option):
+        entry['is_flag'] = param.is_flag
+        entry['help'] = param.help
+        entry['hidden'] = param.hidden
+    return entry
+
+
+def describe_command(cmd, ctx=None):
+    """Serialize a click command, and its subcommands, into a dict."""
+    entry = {
+        'name': cmd.name,
+        'short_help': cmd.get_short_help_str(),
+        'help': cmd.help,
+        'hidden': cmd.hidden,
+        'params': [describe_param(p) for p in cmd.params],
+        'commands': None
+    }
+    if isinstance(cmd, click.Group):
+        entry['commands'] = {}
+        for name in cmd.list_commands(ctx):
+            subcommand = cmd.get_command(ctx, name)
+            if subcommand is not None:
+                entry['commands'][name] = describe_command(subcommand, ctx)
+    return entry
+
+
+def param_from_manifest(entry):
+    """Build a click parameter from its manifest entry."""
+    choices = entry['choices']
+    param_type = click.Choice(choices) if choices is not None else None
+    if entry['kind'] == 'argument':
+        return click.Argument(
+            [entry['name']],
+            type=param_type,
+            nargs=entry['nargs'],
+            required=entry['required'],
+            metavar=entry['metavar'])
+    decls = [entry['name']]
+    secondary_opts = entry['secondary_opts']
+    for n, opt in enumerate(entry['opts']):
+        if n < len(secondary_opts):
+            decls.append('%s/%s' % (opt, secondary_opts[n]))
+        else:
+            decls.append(opt)
+    return click.Option(
+        decls,
+        type=param_type,
+        is_flag=entry['is_flag'] or None,
+        multiple=entry['multiple'],
+        required=entry['required'],
+        metavar=entry['metavar'],
+        help=entry['help'],
+        hidden=entry['hidden'])
+
+
+def command_from_manifest(entry):
+    """Build a callback-less click command from its manifest entry.
+
+    The result carries names, help and parameters only, which is all help
+    listings and shell completion need, and never imports the module that
+    implements the command.
+    """
+    params = [param_from_manifest(p) for p in entry['params']]
+    if entry['commands'] is None:
+        return click.Command(
+            entry['name'],
+            params=params,
+            help=entry['help'],
+            short_help=entry['short_help'],
+            hidden=entry['hidden'])
+    commands = {
+        k: command_from_manifest(v)
+        for k, v in entry['commands'].items()
+    }
+    return click.Group(
+        entry['name'],
+        commands=commands,
+        params=params,
+        help=entry['help'],
+        short_help=entry['short_help'],
+        hidden=entry['hidden'])
+
+
+def load_manifest(path=MANIFEST_PATH):
+    try:
+        with open(os.path.expanduser(path), 'r') as f:
+            return json.load(f)
+    except Exception:
+        return None
+
+
+def save_manifest(manifest, path=MANIFEST_PATH):
+    try:
+        manifest_path = os.path.expanduser(path)
+        parent_dir = os.path.dirname(manifest_path)
+        if not os.path.exists(parent_dir):
+            os.makedirs(parent_dir)
+        with open(manifest_path, 'w') as f:
+            json.dump(manifest, f)
+    except Exception:
+        LOGGER.warning(
+            'Warning: the commands manifest \'%s\' could not be saved.' %
+            path)
+
+
+def get_manifest(group, path=MANIFEST_PATH, rebuild=False):
+    """Return the command manifest of group, rebuilding it when stale.
+
+    The manifest is cached under ~/.vcd-cli and is rebuilt, which imports
+    every command module once, when it is missing or was generated by a
+    different vcd-cli version or set of registered extensions. Commands
+    changed without a new version, e.g. in a development checkout, are only
+    seen when it is rebuilt on request.
+
+    :param click.Group group: the root vcd group.
+    :param str path: location of the manifest file.
+    :param bool rebuild: describe the commands of group and save them even
+        if the cached manifest is current.
+
+    :return: the manifest, with the serialized command tree under 'command'.
+
+    :rtype: dict
+    """
+    global _manifest
+    if _manifest is not None and not rebuild:
+        return _manifest
+    version = installed_version()
+    extensions = (Profiles.load().data or {}).get('extensions') or []
+    manifest = None if rebuild else load_manifest(path)
+    if manifest is None or \
+            manifest.get('version') != version or \
+            manifest.get('extensions') != extensions:
+        # the group serves listings from the manifest, describe the real
+        # commands instead while it is being built
+        listing = getattr(group, 'listing', False)
+        group.listing = False
+        try:
+            command = describe_command(group)
+        finally:
+            group.listing = listing
+        manifest = {
+            'version': version,
+            'extensions': extensions,
+            'command': command
+        }
+        save_manifest(manifest, path)
+    _manifest = manifest
+    return _manifest
@@ -121,12 +121,13 @@ def use(ctx, name):
             in_use_vdc = link.name
             vdc_href = link.href
             break
-        ctx.obj['profiles'].set('org_in_use', str(name))
-        ctx.obj['profiles'].set('org_href', str(org_resource.get('href')))
-        ctx.obj['profiles'].set('vdc_in_use', str(in_use_vdc))
-        ctx.obj['profiles'].set('vdc_href', str(vdc_href))
-        ctx.obj['profiles'].set('vapp_in_use', str(in_use_vapp))
-        ctx.obj['profiles'].set('vapp_href', vapp_href)
+        with ctx.obj['profiles'].transaction():
+            ctx.obj['profiles'].set('org_in_use', str(name))
+            ctx.obj['profiles'].set('org_href', str(org_resource.get('href')))
+            ctx.obj['profiles'].set('vdc_in_use', str(in_use_vdc))
+            ctx.obj['profiles'].set('vdc_href', str(vdc_href))
+            ctx.obj['profiles'].set('vapp_in_use', str(in_use_vapp))
+            ctx.obj['profiles'].set('vapp_href', vapp_href)
         message = 'now using org: \'%s\', vdc: \'%s\', vApp: \'%s\'.' \
             % (name, in_use_vdc, in_use_vapp)
         stdout({
@@ -94,12 +94,9 @@ def list_extensions(ctx):
 def add(ctx, module):
     try:
         profiles = Profiles.load()
-        if 'extensions' not in profiles.data or \
-                profiles.data['extensions'] is None:
-            profiles.data['extensions'] = []
-        if module not in profiles.data['extensions']:
-            profiles.data['extensions'].append(module)
-            profiles.save()
+        extensions = profiles.data.get('extensions') or []
+        if module not in extensions:
+            profiles.set_value('extensions', extensions + [module])
             click.secho('Extension added from module \'%s\'.' % module)
         else:
             raise Exception('module already in the profile')
@@ -120,8 +117,9 @@ def add(ctx, module):
 def delete(ctx, module):
     try:
         profiles = Profiles.load()
-        profiles.data['extensions'].remove(module)
-        profiles.save()
+        extensions = list(profiles.data['extensions'])
+        extensions.remove(module)
+        profiles.set_value('extensions', extensions)
         click.secho('Extension from module \'%s\' deleted.' % module)
     except Exception as e:
         stderr('Could not delete extension from module \'%s\'' % module, ctx)
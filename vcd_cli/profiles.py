@@ -12,31 +12,102 @@
 # conditions of the subcomponent's license, as noted in the LICENSE file.
 #
 
+import contextlib
+import copy
+import json
 import logging
 import os
+import re
+import tempfile
 
 import yaml
 
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
 LOGGER = logging.getLogger(__name__)
 LOGGER.addHandler(logging.FileHandler('vcd.log'))
 
 VCD_CLI_USER_PATH = '~/.vcd-cli'
 PROFILE_PATH = VCD_CLI_USER_PATH + '/profiles.yaml'
 
+# Profile used unless another one is selected with --profile or VCD_PROFILE.
+DEFAULT_PROFILE = 'default'
+
+# Profiles read by this process, by path: (file signature, data).
+_loaded = {}
+
+
+@contextlib.contextmanager
+def file_lock(path, exclusive=False):
+    """Hold an advisory lock on the lock file of a file within the block.
+
+    The lock is taken on path + '.lock' rather than on the file itself, as
+    the file is replaced when saved. Shared locks are held together, an
+    exclusive lock alone. Where fcntl is not available, e.g. on Windows, or
+    the lock file can't be created, nothing is locked; nor is anything when
+    the directory of the file doesn't exist, e.g. before the first login,
+    as there is no file to lock then.
+
+    :param str path: path of the file to lock.
+    :param bool exclusive: take an exclusive lock instead of a shared one.
+    """
+    lock = None
+    if fcntl is not None and os.path.isdir(os.path.dirname(path)):
+        try:
+            lock = open(path + '.lock', 'a')
+        except OSError:
+            LOGGER.warning('Could not lock \'%s\'' % path)
+    if lock is None:
+        yield
+        return
+    with lock:
+        fcntl.flock(lock.fileno(),
+                    fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock.fileno(), fcntl.LOCK_UN)
+
 
 class Profiles(object):
-    def __init__(self):
+    """The profiles file, ~/.vcd-cli/profiles.yaml.
+
+    Changes made with set(), update() and set_value() are recorded as well
+    as applied to data. When saved, they are replayed on the file as it is
+    on disk, under an exclusive lock, so processes changing other profiles,
+    or other properties of the same profile, at the same time don't lose
+    each other's updates.
+
+    get(), set() and update() work on the profile given by their name
+    parameter, or on the selected profile, name, when it is None.
+    """
+
+    def __init__(self, name=None):
         self.path = None
         self.data = None
+        self.name = name or profile_name()
+        self.transactions = 0
+        self.dirty = False
+        self.changes = []
 
     @staticmethod
-    def load(path=PROFILE_PATH):
+    def load(path=PROFILE_PATH, name=None):
+        """Load the profiles file.
+
+        :param str path: path of the profiles file.
+        :param str name: name of the selected profile, None for the one
+            set by VCD_PROFILE or the default one.
+
+        :rtype: Profiles
+        """
         try:
             profile_path = os.path.expanduser(path)
-            p = Profiles()
+            p = Profiles(name)
             p.data = {'active': None}
-            with open(profile_path, 'r') as f:
-                p.data = yaml.safe_load(f)
+            p.data = read_profiles(profile_path)
         except Exception:
             LOGGER.warning(
                 'Warning: the profiles file \'%s\''
@@ -45,16 +116,74 @@ class Profiles(object):
         return p
 
     def save(self):
+        """Write the profiles file.
+
+        The recorded changes are replayed on the profiles read again from
+        the file, under an exclusive lock; when data was changed directly,
+        it is written as is. The profiles are written to a temporary file in
+        the same directory, flushed to disk and then renamed over the
+        profiles file, so readers see either the old or the new file, never
+        a partial one.
+        """
         try:
             parent_dir = os.path.dirname(self.path)
             if not os.path.exists(parent_dir):
                 os.makedirs(parent_dir)
-            stream = open(self.path, 'w')
-            yaml.dump(self.data, stream, default_flow_style=False)
+            with file_lock(self.path, exclusive=True):
+                if len(self.changes) > 0:
+                    data = read_profiles(
+                        self.path, missing_ok=True, lock=False)
+                    for change in self.changes:
+                        apply_change(data, change)
+                    self.data = data
+                fd, tmp_path = tempfile.mkstemp(
+                    dir=parent_dir, prefix='.profiles')
+                try:
+                    with os.fdopen(fd, 'w') as f:
+                        yaml.dump(self.data, f, default_flow_style=False)
+                        f.flush()
+                        os.fsync(f.fileno())
+                    os.replace(tmp_path, self.path)
+                except Exception:
+                    os.remove(tmp_path)
+                    raise
+                remember_profiles(self.path, self.data)
+            self.changes = []
+            self.dirty = False
         except Exception:
             import traceback
             traceback.print_exc()
 
+    @contextlib.contextmanager
+    def transaction(self):
+        """Group updates of the profiles so the file is written only once.
+
+        The profiles changed by set() and update() within the block are
+        saved when the outermost transaction ends without an exception.
+
+        Example:
+            with profiles.transaction():
+                profiles.set('vdc_in_use', vdc_name)
+                profiles.set('vdc_href', vdc_href)
+        """
+        self.transactions += 1
+        try:
+            yield self
+            if self.transactions == 1 and self.dirty:
+                self.save()
+        finally:
+            self.transactions -= 1
+
+    def changed(self, change):
+        if self.data is None:
+            self.data = {}
+        apply_change(self.data, change)
+        self.changes.append(change)
+        if self.transactions > 0:
+            self.dirty = True
+        else:
+            self.save()
+
     def update(self,
                host,
                org,
@@ -71,15 +200,10 @@ class Profiles(object):
                log_body,
                vapp,
                vapp_href,
-               name='default',
+               name=None,
                is_jwt_token=False):
-        if self.data is None:
-            self.data = {}
-        if 'profiles' not in self.data:
-            self.data['profiles'] = []
-
         profile = {}
-        profile['name'] = str(name)
+        profile['name'] = str(name or self.name)
         profile['host'] = str(host)
         profile['org'] = str(org)
         profile['user'] = str(user)
@@ -98,16 +222,10 @@ class Profiles(object):
         profile['vdc_href'] = str(vdc_href)
         profile['vapp_href'] = str(vapp_href)
 
-        tmp = [profile]
-        for p in self.data['profiles']:
-            if p['name'] != name:
-                tmp.append(p)
+        self.changed(('update', profile))
 
-        self.data['profiles'] = tmp
-        self.data['active'] = str(name)
-        self.save()
-
-    def get(self, prop, name='default', default=None):
+    def get(self, prop, name=None, default=None):
+        name = name or self.name
         value = None
         if 'profiles' in self.data.keys():
             for p in self.data['profiles']:
@@ -118,11 +236,156 @@ class Profiles(object):
                         value = default
         return value
 
-    def set(self, prop, value, name='default'):
-        if 'profiles' not in self.data.keys():
-            self.data['profiles'] = {}
-        for p in self.data['profiles']:
+    def set(self, prop, value, name=None):
+        name = name or self.name
+        if any(p['name'] == name for p in self.data.get('profiles') or []):
+            self.changed(('set', name, prop, value))
+
+    def set_value(self, key, value):
+        """Set a top-level key of the profiles file, e.g. 'extensions'."""
+        self.changed(('value', key, value))
+
+
+def profile_name(ctx=None):
+    """Get the name of the profile selected for the command.
+
+    :param click.Context ctx: the click context, whose --profile option
+        takes precedence over the VCD_PROFILE environment variable.
+
+    :rtype: str
+    """
+    if ctx is not None:
+        name = ctx.find_root().params.get('profile')
+        if name:
+            return name
+    return os.environ.get('VCD_PROFILE') or DEFAULT_PROFILE
+
+
+def profile_file(path, name):
+    """Get the path of a file kept per profile, e.g. a cache.
+
+    :param str path: path of the file of the default profile.
+    :param str name: name of the profile.
+
+    :return: path for the default profile, path with '-<name>' inserted
+        before its extension for the others.
+
+    :rtype: str
+    """
+    if name == DEFAULT_PROFILE:
+        return path
+    if re.match(r'^[\w.-]+$', name) is None or name.startswith('.'):
+        raise Exception('Invalid profile name \'%s\'' % name)
+    root, ext = os.path.splitext(path)
+    return '%s-%s%s' % (root, name, ext)
+
+
+def read_profiles(path, missing_ok=False, lock=True):
+    """Read the profiles file, under a shared lock.
+
+    Parsing YAML is slow, so the profiles are only parsed when the file
+    changed since it was last read by this process, or since its compiled
+    cache was written. The file is told to be unchanged by its inode,
+    modification time and size; saving the profiles replaces the file, so
+    its inode changes on every save.
+
+    :param str path: path of the profiles file.
+    :param bool missing_ok: return empty profiles if the file is missing.
+    :param bool lock: take the shared lock, False when the caller holds
+        the exclusive one.
+
+    :return: a copy of the profiles, that the caller can change.
+
+    :rtype: dict
+    """
+    try:
+        with file_lock(path) if lock else contextlib.nullcontext():
+            signature = file_signature(path)
+            loaded = _loaded.get(path)
+            if loaded is None or loaded[0] != signature:
+                data = read_compiled(path, signature)
+                if data is None:
+                    with open(path, 'r') as f:
+                        data = yaml.safe_load(f) or {}
+                    write_compiled(path, signature, data)
+                loaded = _loaded[path] = (signature, data)
+            return copy.deepcopy(loaded[1])
+    except FileNotFoundError:
+        if missing_ok:
+            return {}
+        raise
+
+
+def file_signature(path):
+    st = os.stat(path)
+    return [st.st_ino, st.st_mtime_ns, st.st_size]
+
+
+def read_compiled(path, signature):
+    """Read the compiled cache of a profiles file, path + '.cache'.
+
+    :return: the profiles, or None if the cache is missing or is not the
+        one of the file with the given signature.
+
+    :rtype: dict
+    """
+    try:
+        with open(path + '.cache', 'r') as f:
+            compiled = json.load(f)
+        if compiled.get('signature') == signature:
+            return compiled['data']
+    except Exception:
+        pass
+    return None
+
+
+def write_compiled(path, signature, data):
+    """Write the compiled cache of a profiles file, as JSON.
+
+    The cache is not written when the profiles don't survive a JSON round
+    trip, e.g. when YAML gave dates or non-string keys.
+    """
+    try:
+        text = json.dumps({'signature': signature, 'data': data})
+        if json.loads(text)['data'] != data:
+            return
+        fd, tmp_path = tempfile.mkstemp(
+            dir=os.path.dirname(path), prefix='.profiles')
+        with os.fdopen(fd, 'w') as f:
+            f.write(text)
+        os.replace(tmp_path, path + '.cache')
+    except Exception as e:
+        LOGGER.warning('Could not write the profiles cache: %s' % e)
+
+
+def remember_profiles(path, data):
+    """Remember the profiles just saved, so they are read without parsing."""
+    signature = file_signature(path)
+    data = copy.deepcopy(data)
+    _loaded[path] = (signature, data)
+    write_compiled(path, signature, data)
+
+
+def apply_change(data, change):
+    """Apply a change recorded by Profiles to the profiles data.
+
+    :param dict data: the profiles data, modified in place.
+    :param tuple change: ('update', profile) to add or replace a profile and
+        make it the active one, ('set', name, prop, value) to set a property
+        of a profile, or ('value', key, value) to set a top-level key.
+    """
+    if change[0] == 'update':
+        profile = change[1]
+        data['profiles'] = [profile] + [
+            p for p in data.get('profiles') or []
+            if p['name'] != profile['name']
+        ]
+        data['active'] = profile['name']
+    elif change[0] == 'set':
+        name, prop, value = change[1:]
+        for p in data.get('profiles') or []:
             if p['name'] == name:
                 p[prop] = value
-                self.save()
                 break
+    else:
+        data[change[1]] = change[2]
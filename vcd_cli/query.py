@@ -0,0 +1,128 @@
+# vCloud CLI 0.1
+#
+# Copyright (c) 2014-2018 VMware, Inc. All Rights Reserved.
+#
+# This product is licensed to you under the
+# Apache License, Version 2.0 (the "License").
+# You may not use this product except in compliance with the License.
+#
+# This product may include a number of subcomponents with
+# separate copyright notices and license terms. Your use of the source
+# code for the these subcomponents is subject to the terms and
+# conditions of the subcomponent's license, as noted in the LICENSE file.
+#
+
+import collections
+from concurrent.futures import ThreadPoolExecutor
+
+from pyvcloud.vcd.client import QueryResultFormat
+
+# Number of records requested per query page.
+QUERY_PAGE_SIZE = 128
+
+# Number of query pages fetched at a time.
+QUERY_WORKERS = 4
+
+
+def execute_query(client,
+                  resource_type,
+                  query_result_format=QueryResultFormat.ID_RECORDS,
+                  qfilter=None,
+                  equality_filter=None,
+                  page_size=QUERY_PAGE_SIZE,
+                  limit=None,
+                  workers=QUERY_WORKERS,
+                  fields=None):
+    """Run a typed query, fetching its pages concurrently.
+
+    The first page gives the total number of records; the pages after it
+    are then fetched by up to workers requests at a time, at most workers
+    pages ahead of the records consumed. Records are yielded in the order
+    of the pages, as with a sequential query.
+
+    :param pyvcloud.vcd.client.Client client: the client to query with.
+    :param str resource_type: query resource type, e.g. 'adminVM'.
+    :param QueryResultFormat query_result_format: format of the records.
+    :param str qfilter: query filter.
+    :param tuple equality_filter: (attribute, value) filter AND-ed to
+        qfilter.
+    :param int page_size: number of records requested per page.
+    :param int limit: maximum number of records to return; no more pages
+        than needed are fetched.
+    :param int workers: number of pages fetched at a time.
+    :param list fields: attributes the records are returned with, None for
+        all of them. The projection is applied by vCD, so the attributes
+        left out are neither sent nor parsed.
+
+    :return: a generator of the query records.
+    """
+
+    if fields is not None:
+        fields = ','.join(fields)
+
+    def fetch(page, size):
+        return client.get_typed_query(
+            resource_type,
+            query_result_format=query_result_format,
+            page=page,
+            page_size=size,
+            qfilter=qfilter,
+            equality_filter=equality_filter,
+            fields=fields).execute()
+
+    first = fetch(1, page_size)
+    total = first['resultTotal']
+    if limit is not None:
+        total = min(total, limit)
+    values = first['values'][:total]
+    for record in values:
+        yield record
+    if len(values) == 0 or len(values) >= total:
+        return
+    # vCD may return fewer records per page than requested
+    size = len(values)
+    pages = (total + size - 1) // size
+    count = size
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        window = collections.deque()
+        next_page = 2
+        try:
+            while next_page <= pages and len(window) < workers:
+                window.append(executor.submit(fetch, next_page, size))
+                next_page += 1
+            while len(window) > 0:
+                values = window.popleft().result()['values']
+                if next_page <= pages:
+                    window.append(executor.submit(fetch, next_page, size))
+                    next_page += 1
+                for record in values[:total - count]:
+                    yield record
+                count += len(values)
+        finally:
+            for future in window:
+                future.cancel()
+
+
+def query_total(client, resource_type, qfilter=None, equality_filter=None):
+    """Count the results of a typed query without fetching them.
+
+    Only the first page is requested, with a single reference in it, and
+    the total is read from it.
+
+    :param pyvcloud.vcd.client.Client client: the client to query with.
+    :param str resource_type: query resource type, e.g. 'adminVM'.
+    :param str qfilter: query filter.
+    :param tuple equality_filter: (attribute, value) filter AND-ed to
+        qfilter.
+
+    :return: the number of results of the query.
+
+    :rtype: int
+    """
+    return client.get_typed_query(
+        resource_type,
+        query_result_format=QueryResultFormat.REFERENCES,
+        page=1,
+        page_size=1,
+        qfilter=qfilter,
+        equality_filter=equality_filter).execute()['resultTotal']
@@ -0,0 +1,186 @@
+# vCloud CLI 0.1
+#
+# Copyright (c) 2014-2018 VMware, Inc. All Rights Reserved.
+#
+# This product is licensed to you under the
+# Apache License, Version 2.0 (the "License").
+# You may not use this product except in compliance with the License.
+#
+# This product may include a number of subcomponents with
+# separate copyright notices and license terms. Your use of the source
+# code for the these subcomponents is subject to the terms and
+# conditions of the subcomponent's license, as noted in the LICENSE file.
+#
+
+import contextlib
+import io
+import sys
+import threading
+
+import click
+
+from vcd_cli.vcd import vcd
+
+# Commands after which a shared session has to be restored again.
+SESSION_COMMANDS = ['login', 'logout']
+
+# Commands that can change which href a name resolves to, e.g. vapp delete
+# or vm move.
+MUTATING_COMMANDS = ['create', 'delete', 'update', 'move', 'copy']
+
+
+def with_profile(args, name):
+    """Select a profile for a command line run by shell or batch.
+
+    Each command line is parsed by its own vcd.main() call, so the profile
+    selected by --profile for the shell or batch itself is passed on to it.
+    A --profile set by the command line comes later and takes precedence.
+
+    :param list args: command line arguments, without the leading 'vcd'.
+    :param str name: name of the profile of the shell or batch.
+
+    :return: the arguments, with the profile selected.
+
+    :rtype: list
+    """
+    return ['--profile', name] + list(args)
+
+
+def run_command(args, obj=None):
+    """Run a vcd command line inside the current process.
+
+    Commands report errors through stderr(), which exits the process, or
+    through click exceptions; both, and any other exception a command lets
+    through, are turned into an exit code here so the caller can keep
+    running further commands.
+
+    :param list args: command line arguments, without the leading 'vcd'.
+    :param dict obj: initial context object shared with the command, e.g.
+        {'client': client, 'profiles': profiles} to reuse an authenticated
+        client instead of restoring the session from the profiles file.
+
+    :return: exit code of the command.
+
+    :rtype: int
+    """
+    try:
+        rv = vcd.main(
+            args=list(args), prog_name='vcd', standalone_mode=False, obj=obj)
+        return rv if isinstance(rv, int) else 0
+    except click.ClickException as e:
+        e.show()
+        return e.exit_code
+    except click.Abort:
+        click.echo('Aborted!', err=True)
+        return 1
+    except SystemExit as e:
+        if e.code is None:
+            return 0
+        return e.code if isinstance(e.code, int) else 1
+    except Exception as e:
+        click.echo('Error: %s' % e, err=True)
+        return 1
+
+
+class OutputRouter(io.TextIOBase):
+    """Text stream writing to a stream registered by the current thread.
+
+    Threads that did not register a stream write to the default stream, so
+    the router can stand in for sys.stdout or sys.stderr while some threads
+    capture the output of the commands they run.
+    """
+
+    encoding = 'utf-8'
+    errors = 'strict'
+
+    def __init__(self, default):
+        self.default = default
+        self.local = threading.local()
+
+    def target(self):
+        return getattr(self.local, 'stream', None) or self.default
+
+    def write(self, text):
+        return self.target().write(text)
+
+    def flush(self):
+        self.target().flush()
+
+    def isatty(self):
+        return self.target().isatty()
+
+
+_routers = None
+_router_users = 0
+_routers_lock = threading.Lock()
+
+
+@contextlib.contextmanager
+def _routed_output():
+    """Route sys.stdout and sys.stderr through OutputRouters while in use."""
+    global _routers, _router_users
+    with _routers_lock:
+        if _router_users == 0:
+            _routers = (OutputRouter(sys.stdout), OutputRouter(sys.stderr))
+            sys.stdout, sys.stderr = _routers
+        _router_users += 1
+        routers = _routers
+    try:
+        yield routers
+    finally:
+        with _routers_lock:
+            _router_users -= 1
+            if _router_users == 0:
+                sys.stdout = routers[0].default
+                sys.stderr = routers[1].default
+                _routers = None
+
+
+def run_command_captured(args, obj=None):
+    """Run a vcd command line in-process and capture what it prints.
+
+    Unlike run_command, this can be called from several threads at once,
+    the output of each command is kept apart.
+
+    :param list args: command line arguments, without the leading 'vcd'.
+    :param dict obj: initial context object shared with the command.
+
+    :return: exit code, standard output and standard error of the command.
+
+    :rtype: tuple
+    """
+    out = io.StringIO()
+    err = io.StringIO()
+    with _routed_output() as (stdout_router, stderr_router):
+        stdout_router.local.stream = out
+        stderr_router.local.stream = err
+        try:
+            exit_code = run_command(args, obj)
+        finally:
+            stdout_router.local.stream = None
+            stderr_router.local.stream = None
+    return exit_code, out.getvalue(), err.getvalue()
+
+
+def update_shared_state(obj, args, exit_code):
+    """Keep a context object shared by consecutive command lines current.
+
+    The session is dropped after login and logout so the next command
+    restores the new one, and cached name resolutions are dropped after
+    commands that may change them, as told by the name of the subcommand
+    run, e.g. 'vapp delete', and after failures.
+
+    :param dict obj: the shared context object.
+    :param list args: command line that was run.
+    :param int exit_code: exit code of the command.
+    """
+    cache = obj.get('resolution_cache')
+    path = vcd.command_path(args)
+    if len(path) > 0 and path[0] in SESSION_COMMANDS:
+        obj.pop('client', None)
+        obj.pop('profiles', None)
+        if cache is not None:
+            cache.clear()
+    elif cache is not None and (exit_code != 0 or (
+            len(path) > 1 and path[-1] in MUTATING_COMMANDS)):
+        cache.clear()
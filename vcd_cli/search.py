@@ -13,15 +13,23 @@
 #
 
 import click
-from pyvcloud.vcd.client import QueryResultFormat
 from pyvcloud.vcd.client import RESOURCE_TYPES
+from pyvcloud.vcd.utils import filter_attributes
 from pyvcloud.vcd.utils import to_camel_case
 from pyvcloud.vcd.utils import to_dict
 from tabulate import tabulate
 
+from vcd_cli.inventory import INVENTORY_TYPES
+from vcd_cli.inventory import snapshot_records
+from vcd_cli.query import execute_query
+from vcd_cli.query import QUERY_PAGE_SIZE
+from vcd_cli.query import query_total
+from vcd_cli.utils import output_format
 from vcd_cli.utils import restore_session
+from vcd_cli.utils import split_fields
 from vcd_cli.utils import stderr
 from vcd_cli.utils import stdout
+from vcd_cli.utils import stdout_stream
 from vcd_cli.utils import tabulate_names
 from vcd_cli.vcd import vcd
 
@@ -36,7 +44,57 @@ from vcd_cli.vcd import vcd
     required=False,
     metavar='[query-filter]',
     help='query filter')
-def search(ctx, resource_type, query_filter):
+@click.option(
+    '-i',
+    '--inventory',
+    'from_inventory',
+    is_flag=True,
+    default=False,
+    help='Serve from the local inventory snapshot, updated first')
+@click.option(
+    '--page-size',
+    metavar='<n>',
+    type=click.IntRange(min=1),
+    default=None,
+    help='Number of records fetched per request')
+@click.option(
+    '--limit',
+    metavar='<n>',
+    type=click.IntRange(min=1),
+    default=None,
+    help='Stop after this number of records')
+@click.option(
+    '-s',
+    '--stream',
+    is_flag=True,
+    default=False,
+    help='Print JSON records as they are fetched, one per line; tables are '
+    'always printed as records are fetched')
+@click.option(
+    '--fields',
+    metavar='<attr,...>',
+    callback=split_fields,
+    default=None,
+    help='Comma separated attributes to fetch and show')
+@click.option(
+    '-c',
+    '--count',
+    is_flag=True,
+    default=False,
+    help='Only show the number of records found')
+@click.option(
+    '--group-by',
+    metavar='<attr>',
+    default=None,
+    help='Count the records per value of this attribute')
+@click.option(
+    '--sum',
+    'sums',
+    metavar='<attr>',
+    multiple=True,
+    help='Add up this numeric attribute, per group with --group-by')
+def search(ctx, resource_type, query_filter, from_inventory, page_size,
+           limit, stream, fields, count, group_by, sums):
     """Search for resources in vCloud Director.
 
 \b
@@ -81,6 +139,34 @@ def search(ctx, resource_type, query_filter):
 \b
         vcd search vm
             Search for virtual machines.
+\b
+        vcd search vm --inventory -f 'status==POWERED_ON'
+            Search for powered on virtual machines in the local inventory,
+            after fetching the changes since it was last synced. Filters
+            served from the inventory are attribute==value conditions
+            joined by ';'.
+\b
+        vcd --column-width 20 search adminvm --page-size 128
+            Print all virtual machines as they are fetched, in columns of
+            20 characters.
+\b
+        vcd -j search adminvm --stream --limit 1000
+            Print the first 1000 virtual machines as JSON lines.
+\b
+        vcd search adminvm --fields name,status,vdcName
+            Search for virtual machines, fetching only their name, status
+            and vDC from vCloud Director.
+\b
+        vcd search adminvm --count -f 'status==POWERED_ON'
+            Show the number of powered on virtual machines, without
+            fetching them.
+\b
+        vcd search adminvm --group-by status
+            Show the number of virtual machines per status.
+\b
+        vcd search adminvapp --group-by vdcName --sum memoryAllocationMB
+            Show the memory allocated to vApps per vDC. Records are added
+            up as they are fetched, only the attributes used are fetched.
     """
 
     try:
@@ -91,18 +177,126 @@ def search(ctx, resource_type, query_filter):
             return
         restore_session(ctx)
         client = ctx.obj['client']
-        result = []
         resource_type_cc = to_camel_case(resource_type, RESOURCE_TYPES)
-        q = client.get_typed_query(
+        aggregated = group_by is not None or len(sums) > 0
+        if count and (aggregated or stream):
+            raise Exception('--count can\'t be used with --group-by, --sum '
+                            'or --stream')
+        if aggregated and fields is None:
+            fields = ([group_by] if group_by is not None else []) + list(sums)
+        if from_inventory:
+            result = search_inventory(ctx, resource_type_cc, query_filter,
+                                      fields)
+            if count:
+                result = {'count': 0 if result == 'not found' else len(result)}
+            elif aggregated and result != 'not found':
+                result = aggregate(result, group_by, sums)
+            stdout(result, ctx, show_id=True)
+            return
+        if count:
+            total = query_total(client, resource_type_cc, qfilter=query_filter)
+            if limit is not None:
+                total = min(total, limit)
+            stdout({'count': total}, ctx)
+            return
+        records = execute_query(
+            client,
             resource_type_cc,
-            query_result_format=QueryResultFormat.ID_RECORDS,
-            qfilter=query_filter)
-        records = list(q.execute())
-        if len(records) == 0:
-            result = 'not found'
+            qfilter=query_filter,
+            page_size=page_size or QUERY_PAGE_SIZE,
+            limit=limit,
+            fields=fields)
+        if fields is None:
+            records = (to_dict(r, resource_type=resource_type_cc)
+                       for r in records)
         else:
-            for r in records:
-                result.append(to_dict(r, resource_type=resource_type_cc))
+            records = (to_dict(r, attributes=fields) for r in records)
+        if aggregated:
+            result = aggregate(records, group_by, sums)
+            if len(result) == 0:
+                result = 'not found'
+            stdout(result, ctx)
+            return
+        if stream or output_format(ctx) != 'json':
+            if stdout_stream(records, ctx, show_id=True) == 0:
+                stdout('not found', ctx)
+            return
+        result = list(records)
+        if len(result) == 0:
+            result = 'not found'
         stdout(result, ctx, show_id=True)
     except Exception as e:
         stderr(e, ctx)
+
+
+def search_inventory(ctx, resource_type, query_filter, fields=None):
+    """Search for resources in the local inventory snapshot.
+
+    :param click.Context ctx: the click context, with a restored session.
+    :param str resource_type: query resource type, e.g. 'adminVApp'.
+    :param str query_filter: attribute==value conditions joined by ';'.
+    :param list fields: attributes to show, None for the default ones.
+
+    :return: the resources found, or 'not found'.
+    """
+    kinds = [
+        k for k, (org_type, admin_type, f) in INVENTORY_TYPES.items()
+        if resource_type in [org_type.value, admin_type.value]
+    ]
+    if len(kinds) == 0:
+        raise Exception('%s is not kept in the inventory' % resource_type)
+    conditions = []
+    for condition in (query_filter or '').split(';'):
+        if condition == '':
+            continue
+        attribute, sep, value = condition.partition('==')
+        if sep == '' or '=' in attribute or ',' in condition:
+            raise Exception('only attribute==value conditions joined by '
+                            '\';\' can be served from the inventory')
+        conditions.append((attribute, value))
+    records = snapshot_records(ctx, kinds[0], filters=conditions)[1]
+    if len(records) == 0:
+        return 'not found'
+    attributes = fields or filter_attributes(resource_type)
+    if attributes is not None:
+        records = [{k: r.get(k) for k in attributes} for r in records]
+    return records
+
+
+def aggregate(records, group_by=None, sums=()):
+    """Count records and add up attributes of them, as they are read.
+
+    :param iterable records: the records, as dictionaries.
+    :param str group_by: attribute to group the records by, None for a
+        single group of all of them.
+    :param tuple sums: numeric attributes to add up per group.
+
+    :return: one dictionary per group, with the group_by value, the number
+        of records and the sums, sorted by group_by value.
+
+    :rtype: list
+    """
+    groups = {}
+    for r in records:
+        key = r.get(group_by) if group_by is not None else None
+        row = groups.get(key)
+        if row is None:
+            row = {} if group_by is None else {group_by: key}
+            row['count'] = 0
+            for attribute in sums:
+                row[attribute] = 0
+            groups[key] = row
+        row['count'] += 1
+        for attribute in sums:
+            value = r.get(attribute)
+            if value is None or value == '':
+                continue
+            try:
+                row[attribute] += int(value)
+            except ValueError:
+                try:
+                    row[attribute] += float(value)
+                except ValueError:
+                    raise Exception('%s is not numeric: %s' % (attribute,
+                                                               value))
+    return [groups[k] for k in sorted(groups, key=lambda k: str(k))]
@@ -0,0 +1,88 @@
+# vCloud CLI 0.1
+#
+# Copyright (c) 2014-2018 VMware, Inc. All Rights Reserved.
+#
+# This product is licensed to you under the
+# Apache License, Version 2.0 (the "License").
+# You may not use this product except in compliance with the License.
+#
+# This product may include a number of subcomponents with
+# separate copyright notices and license terms. Your use of the source
+# code for the these subcomponents is subject to the terms and
+# conditions of the subcomponent's license, as noted in the LICENSE file.
+#
+
+import shlex
+
+import click
+
+from vcd_cli.cache import ResolutionCache
+from vcd_cli.profiles import profile_name
+from vcd_cli.runner import run_command
+from vcd_cli.runner import update_shared_state
+from vcd_cli.runner import with_profile
+from vcd_cli.vcd import vcd
+
+try:
+    import readline  # NOQA
+except ImportError:
+    pass
+
+
+@vcd.command(short_help='run commands in an interactive shell')
+@click.pass_context
+def shell(ctx):
+    """Run vcd commands in an interactive shell.
+
+\b
+    Description
+        Reads vcd command lines, with or without the leading 'vcd', and
+        runs them in the shell process. The session is restored once and
+        shared by every command, and the hrefs of the vApps, VMs and
+        gateways looked up by name are cached for the life of the shell.
+        The cache is cleared after commands that create, delete, rename or
+        move entities and after any command that fails.
+\b
+        Commands use the profile selected for the shell, e.g. with
+        'vcd --profile <name> shell', unless they select another one with
+        --profile.
+\b
+        Enter 'exit' or 'quit', or press Ctrl-D, to leave the shell.
+\b
+    Examples
+        vcd shell
+            Start an interactive shell.
+\b
+        vcd> vapp list
+        vcd> vm info vapp1 vm1
+        vcd> vm power-on vapp1 vm1
+            Commands as entered in the shell.
+    """
+    name = profile_name(ctx)
+    obj = {'resolution_cache': ResolutionCache()}
+    while True:
+        try:
+            line = input('vcd> ')
+        except EOFError:
+            click.echo()
+            break
+        except KeyboardInterrupt:
+            click.echo()
+            continue
+        try:
+            args = shlex.split(line)
+        except ValueError as e:
+            click.secho('Error: %s' % e, err=True)
+            continue
+        if len(args) > 0 and args[0] == 'vcd':
+            args = args[1:]
+        if len(args) == 0:
+            continue
+        if args[0] in ['exit', 'quit']:
+            break
+        try:
+            exit_code = run_command(with_profile(args, name), obj)
+        except KeyboardInterrupt:
+            click.echo()
+            exit_code = 1
+        update_shared_state(obj, args, exit_code)
@@ -0,0 +1,105 @@
+# vCloud CLI 0.1
+#
+# Copyright (c) 2014-2018 VMware, Inc. All Rights Reserved.
+#
+# This product is licensed to you under the
+# Apache License, Version 2.0 (the "License").
+# You may not use this product except in compliance with the License.
+#
+# This product may include a number of subcomponents with
+# separate copyright notices and license terms. Your use of the source
+# code for the these subcomponents is subject to the terms and
+# conditions of the subcomponent's license, as noted in the LICENSE file.
+#
+
+import itertools
+
+# Number of rows the column widths are measured on.
+TABLE_SAMPLE_SIZE = 100
+
+# Spaces between columns, and around headers, as tabulate does.
+COLUMN_SEPARATOR = '  '
+HEADER_PADDING = 2
+
+
+def cell_text(value):
+    if value is None:
+        return ''
+    return str(value).replace('\n', ' ')
+
+
+def is_number(text):
+    try:
+        float(text)
+        return True
+    except ValueError:
+        return False
+
+
+class TableWriter(object):
+    """Renders rows as a table while they are produced.
+
+    The layout is the one of tabulate's 'simple' format, but the column
+    widths are measured on the first rows only, sample_size of them, or are
+    fixed; the rows after them are printed as they come, and their values
+    are truncated when longer than their column. Numeric columns, aligned
+    to the right, are also told from the sample, whether the widths are
+    fixed or not. Only the sample is held in memory.
+    """
+
+    def __init__(self,
+                 headers,
+                 sample_size=TABLE_SAMPLE_SIZE,
+                 column_width=None,
+                 show_header=True):
+        """Constructor for TableWriter objects.
+
+        :param list headers: names of the columns.
+        :param int sample_size: number of rows the widths and the numeric
+            columns are measured on.
+        :param int column_width: width of every column, None to measure
+            them.
+        :param bool show_header: print the header and its underline.
+        """
+        self.headers = headers
+        self.sample_size = sample_size
+        self.column_width = column_width
+        self.show_header = show_header
+
+    def lines(self, rows):
+        """Render rows, lists of values in the order of the headers.
+
+        :param rows: iterable of rows, e.g. a generator over query records.
+
+        :return: a generator of the lines of the table.
+        """
+        rows = (list(map(cell_text, row)) for row in rows)
+        sample = list(itertools.islice(rows, self.sample_size))
+        if self.column_width is not None:
+            widths = [self.column_width] * len(self.headers)
+        else:
+            widths = []
+            for i, header in enumerate(self.headers):
+                lengths = [len(row[i]) for row in sample]
+                if self.show_header:
+                    lengths.append(len(header) + HEADER_PADDING)
+                widths.append(max(lengths, default=0))
+        numeric = [
+            len(sample) > 0 and all(
+                row[i] == '' or is_number(row[i]) for row in sample)
+            for i in range(len(self.headers))
+        ]
+        if self.show_header:
+            yield self.format(self.headers, widths, numeric)
+            yield COLUMN_SEPARATOR.join('-' * w for w in widths)
+        for row in itertools.chain(sample, rows):
+            yield self.format(row, widths, numeric)
+
+    def format(self, values, widths, numeric):
+        cells = []
+        for value, width, right in zip(values, widths, numeric):
+            if len(value) > width:
+                value = value[:width - 3] + '...' if width > 3 else \
+                    value[:width]
+            cells.append(value.rjust(width) if right else value.ljust(width))
+        return COLUMN_SEPARATOR.join(cells).rstrip()
@@ -11,20 +11,32 @@
 # conditions of the subcomponent's license, as noted in the LICENSE file.
 #
 
+from concurrent.futures import ThreadPoolExecutor
+
 import click
 from pyvcloud.vcd.client import EntityType
 from pyvcloud.vcd.client import RelationType
 from pyvcloud.vcd.client import TaskStatus
 from pyvcloud.vcd.task import Task
+from pyvcloud.vcd.utils import extract_id
 from pyvcloud.vcd.utils import task_to_dict
 from pyvcloud.vcd.utils import to_dict
 
+from vcd_cli.task_waiter import task_uuid
 from vcd_cli.utils import as_metavar
+from vcd_cli.utils import output_format
 from vcd_cli.utils import restore_session
 from vcd_cli.utils import stderr
 from vcd_cli.utils import stdout
+from vcd_cli.utils import stdout_stream
+from vcd_cli.utils import task_result_dict
+from vcd_cli.utils import task_result_text
+from vcd_cli.utils import task_waiter
 from vcd_cli.vcd import vcd
 
+# Number of tasks fetched at a time before waiting for them.
+TASK_FETCH_WORKERS = 8
+
 
 @vcd.group(short_help='work with tasks')
 @click.pass_context
@@ -41,6 +53,13 @@ def task(ctx):
 \b
         vcd task wait 4a115aa5-9657-4d97-a8c2-3faf43fb45dd
             Wait until task is complete.
+\b
+        vcd task wait 4a115aa5-9657-4d97-a8c2-3faf43fb45dd \\
+                      2b3d5a12-3c1f-4c39-9e0e-8cf1c6a5b0f4
+            Wait until both tasks are complete.
+\b
+        vcd task wait --any -
+            Wait until one of the tasks read from the input is complete.
 \b
         vcd task update aborted 4a115aa5-9657-4d97-a8c2-3faf43fb45dd
             Abort task by id, requires login as 'system administrator'.
@@ -89,17 +108,74 @@ def list_tasks(ctx, status):
         stderr(e, ctx)
 
 
-@task.command(short_help='wait until task is complete')
+@task.command(short_help='wait until tasks are complete')
 @click.pass_context
-@click.argument('task_id', metavar='<id>', required=True)
-def wait(ctx, task_id):
+@click.argument('task_ids', metavar='<id>...|-', nargs=-1, required=True)
+@click.option(
+    '--all/--any',
+    'wait_all',
+    default=True,
+    help='Wait until all tasks are complete (default) or until one is')
+def wait(ctx, task_ids, wait_all):
+    """Wait until tasks are complete.
+
+\b
+    Description
+        Waits for the tasks given by id, or by href, or read from the
+        standard input when the argument is '-'. The tasks are waited for
+        together and the result of each task is printed as soon as it is
+        complete, one line per task; with --json, one JSON object per line
+        with the keys 'task', 'operation', 'status' and 'message'.
+\b
+        With --any, waiting stops when the first task is complete. The exit
+        code is 1 if a task reported is not successful.
+\b
+    Examples
+        vcd task wait 4a115aa5-9657-4d97-a8c2-3faf43fb45dd
+            Wait until task is complete.
+\b
+        cat task-ids.txt | vcd task wait -
+            Wait for the tasks whose ids are read from the input.
+\b
+        vcd task wait --any 4a115aa5-9657-4d97-a8c2-3faf43fb45dd \\
+                            2b3d5a12-3c1f-4c39-9e0e-8cf1c6a5b0f4
+            Wait until one of the tasks is complete.
+    """
+    failed = False
     try:
         restore_session(ctx)
         client = ctx.obj['client']
-        task = client.get_resource(f"{client.get_api_uri()}/task/{task_id}")
-        stdout(task, ctx)
+        if '-' in task_ids:
+            task_ids = [t for t in task_ids if t != '-'] + \
+                click.get_text_stream('stdin').read().split()
+        hrefs = [
+            f"{client.get_api_uri()}/task/{task_uuid(extract_id(t))}"
+            for t in task_ids
+        ]
+        with ThreadPoolExecutor(max_workers=TASK_FETCH_WORKERS) as executor:
+            tasks = list(executor.map(client.get_resource, hrefs))
+        waiter = task_waiter(ctx)
+        for t in tasks:
+            waiter.add(t)
+        statuses = []
+
+        def finished():
+            for t in waiter.wait():
+                statuses.append(t.get('status'))
+                yield t
+                if not wait_all:
+                    break
+
+        if output_format(ctx) == 'table':
+            for t in finished():
+                click.echo(task_result_text(t))
+        else:
+            stdout_stream((task_result_dict(t) for t in finished()), ctx)
+        failed = any(s != TaskStatus.SUCCESS.value for s in statuses)
     except Exception as e:
         stderr(e, ctx)
+    if failed:
+        ctx.exit(1)
 
 
 @task.command(short_help='update task status')
@@ -0,0 +1,183 @@
+# vCloud CLI 0.1
+#
+# Copyright (c) 2014-2018 VMware, Inc. All Rights Reserved.
+#
+# This product is licensed to you under the
+# Apache License, Version 2.0 (the "License").
+# You may not use this product except in compliance with the License.
+#
+# This product may include a number of subcomponents with
+# separate copyright notices and license terms. Your use of the source
+# code for the these subcomponents is subject to the terms and
+# conditions of the subcomponent's license, as noted in the LICENSE file.
+#
+
+import logging
+import ssl
+import threading
+
+LOGGER = logging.getLogger(__name__)
+
+# Seconds to wait for the subscription to the notification exchange.
+CONNECT_TIMEOUT = 10
+
+# Seconds between the fallback polls of tasks while listening for events.
+EVENT_POLL_INTERVAL = 30
+
+
+def pika_connect(settings):
+    """Open a blocking connection to an AMQP broker with pika.
+
+    :param dict settings: the 'task_events' settings of the profiles file.
+
+    :return: the connection.
+
+    :rtype: pika.BlockingConnection
+    """
+    import pika
+    ssl_options = None
+    if settings.get('ssl'):
+        ssl_options = pika.SSLOptions(ssl.create_default_context(),
+                                      settings.get('host'))
+    parameters = pika.ConnectionParameters(
+        host=settings.get('host'),
+        port=int(settings.get('port', 5671 if ssl_options else 5672)),
+        virtual_host=settings.get('vhost', '/'),
+        credentials=pika.PlainCredentials(
+            settings.get('user', 'guest'), settings.get('password', 'guest')),
+        ssl_options=ssl_options)
+    return pika.BlockingConnection(parameters)
+
+
+class TaskEventListener(object):
+    """Listens to the vCD notification exchange for task events.
+
+    vCD publishes a notification for every task event to the exchange set
+    in its AMQP settings, with routing keys of the form
+    'operationSuccess.entityUUID.orgUUID.userUUID.type...'. The listener
+    binds a private queue to the keys of the tasks waited for, on a
+    thread of its own, and wakes up the waiter whenever one of them has an
+    event; the waiter then polls the task as usual.
+    """
+
+    def __init__(self, settings, connect=pika_connect):
+        """Constructor for TaskEventListener objects.
+
+        :param dict settings: the 'task_events' settings of the profiles
+            file: host, port, user, password, vhost, exchange and ssl.
+        :param function connect: opens a connection to the broker from the
+            settings, a stand-in broker can be plugged in here.
+        """
+        self.settings = settings
+        self.connect = connect
+        self.connection = None
+        self.channel = None
+        self.thread = None
+        self.error = None
+        self.ready = threading.Event()
+        self.lock = threading.Condition()
+        self.arrived = set()
+
+    def start(self, uuids):
+        """Subscribe to the events of tasks and listen in the background.
+
+        :param list uuids: uuids of the tasks to listen for.
+
+        :raises Exception: if the subscription fails.
+        """
+        self.thread = threading.Thread(target=self.run, args=(list(uuids), ))
+        self.thread.daemon = True
+        self.thread.start()
+        if not self.ready.wait(CONNECT_TIMEOUT):
+            raise Exception('timed out connecting to the AMQP broker')
+        if self.error is not None:
+            raise self.error
+
+    def run(self, uuids):
+        try:
+            self.connection = self.connect(self.settings)
+            self.channel = self.connection.channel()
+            queue = self.channel.queue_declare(
+                queue='', exclusive=True).method.queue
+            exchange = self.settings.get('exchange', 'systemExchange')
+            for uuid in uuids:
+                self.channel.queue_bind(
+                    exchange=exchange,
+                    queue=queue,
+                    routing_key='*.%s.#' % uuid)
+            self.channel.basic_consume(
+                queue=queue, on_message_callback=self.on_message,
+                auto_ack=True)
+        except Exception as e:
+            self.error = e
+            self.ready.set()
+            return
+        self.ready.set()
+        try:
+            self.channel.start_consuming()
+        except Exception as e:
+            LOGGER.warning('Task events are lost: %s' % e)
+
+    def on_message(self, channel, method, properties, body):
+        self.handle(method.routing_key)
+
+    def handle(self, routing_key):
+        """Record the event of a message with the given routing key."""
+        parts = routing_key.split('.')
+        if len(parts) > 1:
+            with self.lock:
+                self.arrived.add(parts[1])
+                self.lock.notify_all()
+
+    def wait(self, uuids, timeout):
+        """Wait for an event of one of the tasks.
+
+        :param set uuids: uuids of the tasks still waited for.
+        :param float timeout: longest time to wait, in seconds.
+
+        :return: uuids of the tasks that had events.
+
+        :rtype: set
+        """
+        with self.lock:
+            self.lock.wait_for(lambda: len(self.arrived & uuids) > 0,
+                               timeout)
+            arrived = self.arrived & uuids
+            self.arrived -= arrived
+            return arrived
+
+    def stop(self):
+        if self.connection is None:
+            return
+        try:
+            self.connection.add_callback_threadsafe(self.shutdown)
+            self.thread.join(CONNECT_TIMEOUT)
+        except Exception as e:
+            LOGGER.warning('Could not close the AMQP connection: %s' % e)
+
+    def shutdown(self):
+        self.channel.stop_consuming()
+        self.connection.close()
+
+
+def task_event_listener(profiles):
+    """Build the task event listener set up in the profiles file, if any.
+
+    Events are used when the profiles file has a 'task_events' section and
+    the optional pika package is installed (pip install vcd-cli[amqp]).
+
+    :param vcd_cli.profiles.Profiles profiles: the loaded profiles.
+
+    :return: a listener, or None to poll tasks only.
+
+    :rtype: TaskEventListener
+    """
+    settings = (profiles.data or {}).get('task_events')
+    if not settings:
+        return None
+    try:
+        import pika  # NOQA
+    except ImportError:
+        LOGGER.warning('Task events need the pika package, polling instead.')
+        return None
+    return TaskEventListener(settings)
@@ -0,0 +1,254 @@
+# vCloud CLI 0.1
+#
+# Copyright (c) 2014-2018 VMware, Inc. All Rights Reserved.
+#
+# This product is licensed to you under the
+# Apache License, Version 2.0 (the "License").
+# You may not use this product except in compliance with the License.
+#
+# This product may include a number of subcomponents with
+# separate copyright notices and license terms. Your use of the source
+# code for the these subcomponents is subject to the terms and
+# conditions of the subcomponent's license, as noted in the LICENSE file.
+#
+
+import logging
+import time
+
+from pyvcloud.vcd.client import QueryResultFormat
+from pyvcloud.vcd.client import ResourceType
+from pyvcloud.vcd.client import TaskStatus
+from pyvcloud.vcd.exceptions import TaskTimeoutException
+
+from vcd_cli.task_events import EVENT_POLL_INTERVAL
+
+LOGGER = logging.getLogger(__name__)
+
+FINAL_TASK_STATUSES = [
+    TaskStatus.SUCCESS, TaskStatus.ABORTED, TaskStatus.ERROR,
+    TaskStatus.CANCELED
+]
+
+# Maximum number of task ids filtered on in one task query.
+QUERY_BATCH_SIZE = 25
+
+POLL_STRATEGIES = ['fixed', 'exponential', 'adaptive']
+
+
+def task_uuid(href):
+    """Return the uuid at the end of a task href."""
+    return href.rstrip('/').split('/')[-1]
+
+
+def is_task_final(task):
+    return task.get('status').lower() in \
+        [s.value for s in FINAL_TASK_STATUSES]
+
+
+def task_progress(task):
+    """Return the progress in percent reported by a task, or None."""
+    if task is None or not hasattr(task, 'Progress'):
+        return None
+    try:
+        return int(task.Progress)
+    except (TypeError, ValueError):
+        return None
+
+
+class PollPolicy(object):
+    """Decides how often tasks are polled and for how long.
+
+    fixed polls every FIXED_INTERVAL seconds. exponential starts at
+    MIN_INTERVAL and doubles the interval after every poll, up to
+    MAX_INTERVAL. adaptive starts the same way and grows by half after
+    every poll, but when the task reports its progress the next poll is
+    timed from the remaining time that progress suggests.
+    """
+
+    FIXED_INTERVAL = 5
+    MIN_INTERVAL = 0.2
+    MAX_INTERVAL = 10
+
+    def __init__(self, strategy='adaptive', timeout=None):
+        """Constructor for PollPolicy objects.
+
+        :param str strategy: one of POLL_STRATEGIES.
+        :param float timeout: seconds after which waiting is given up, or
+            None or 0 to wait as long as it takes.
+        """
+        if strategy not in POLL_STRATEGIES:
+            raise Exception('unknown poll strategy \'%s\'' % strategy)
+        self.strategy = strategy
+        self.timeout = float(timeout) if timeout else None
+
+    def first_interval(self):
+        if self.strategy == 'fixed':
+            return self.FIXED_INTERVAL
+        return self.MIN_INTERVAL
+
+    def next_interval(self, interval, elapsed, progress=None):
+        """Compute the time to wait before the next poll.
+
+        :param float interval: the time waited before the last poll.
+        :param float elapsed: seconds since waiting started.
+        :param int progress: progress in percent of the slowest pending
+            task, if known.
+
+        :return: seconds to wait.
+
+        :rtype: float
+        """
+        if self.strategy == 'fixed':
+            return self.FIXED_INTERVAL
+        if self.strategy == 'exponential':
+            return min(interval * 2, self.MAX_INTERVAL)
+        if progress is not None and 0 < progress < 100:
+            remaining = elapsed * (100 - progress) / progress
+            return max(self.MIN_INTERVAL, min(remaining / 2,
+                                              self.MAX_INTERVAL))
+        return min(interval * 1.5, self.MAX_INTERVAL)
+
+
+class TaskWaiter(object):
+    """Waits for many vCD tasks at once.
+
+    While more than one task is pending, the pending tasks are polled with
+    one typed query per QUERY_BATCH_SIZE tasks, filtered by task id, rather
+    than with one GET per task; a single pending task is fetched directly.
+    Each task is fetched in full once, when it reaches a final status.
+
+    The time between polls is set by a PollPolicy and starts over from the
+    first interval whenever a task finishes.
+    """
+
+    def __init__(self, client, policy=None, events=None):
+        """Constructor for TaskWaiter objects.
+
+        :param pyvcloud.vcd.client.Client client: the client used to poll.
+        :param PollPolicy policy: how often to poll and for how long,
+            adaptive polling without a timeout by default.
+        :param vcd_cli.task_events.TaskEventListener events: listener for
+            task events. While it runs, tasks are polled when they have an
+            event and otherwise only every EVENT_POLL_INTERVAL seconds.
+        """
+        self.client = client
+        self.policy = policy or PollPolicy()
+        self.events = events
+        self.pending = {}
+        self.total = 0
+
+    @property
+    def complete(self):
+        return self.total - len(self.pending)
+
+    def add(self, task):
+        """Add a task, or task href, to wait for."""
+        href = task if isinstance(task, str) else task.get('href')
+        if href not in self.pending:
+            self.pending[href] = task if not isinstance(task, str) else None
+            self.total += 1
+
+    def wait(self, callback=None):
+        """Wait for the tasks, yielding each one as soon as it is final.
+
+        :param function callback: called with the waiter after every poll,
+            its pending dict holds the last polled state of each pending
+            task.
+
+        :return: a generator of the final task resources, in the order they
+            finish.
+
+        :raises TaskTimeoutException: if tasks are still pending when the
+            timeout of the policy expires.
+        """
+        events = self.start_events()
+        try:
+            for task in self.poll_until_done(events, callback):
+                yield task
+        finally:
+            if events is not None:
+                events.stop()
+
+    def start_events(self):
+        if self.events is None or len(self.pending) == 0:
+            return None
+        try:
+            self.events.start(task_uuid(href) for href in self.pending)
+            return self.events
+        except Exception as e:
+            LOGGER.warning('Task events are not available, polling '
+                           'instead: %s' % e)
+            return None
+
+    def poll_until_done(self, events, callback):
+        start = time.time()
+        interval = self.policy.first_interval()
+        while len(self.pending) > 0:
+            finished = self.poll()
+            for href in finished:
+                del self.pending[href]
+            if callback is not None:
+                callback(self)
+            for task in finished.values():
+                yield task
+            if len(self.pending) == 0:
+                break
+            if events is not None:
+                interval = EVENT_POLL_INTERVAL
+            elapsed = time.time() - start
+            if self.policy.timeout is not None:
+                if elapsed >= self.policy.timeout:
+                    raise TaskTimeoutException(
+                        'Task timeout, %s of %s tasks complete after %ss' %
+                        (self.complete, self.total, self.policy.timeout))
+                interval = min(interval, self.policy.timeout - elapsed)
+            if events is not None:
+                events.wait({task_uuid(href) for href in self.pending},
+                            interval)
+                continue
+            time.sleep(interval)
+            if len(finished) > 0:
+                interval = self.policy.first_interval()
+            else:
+                progress = [task_progress(t) for t in self.pending.values()]
+                progress = [p for p in progress if p is not None]
+                interval = self.policy.next_interval(
+                    interval,
+                    time.time() - start,
+                    min(progress) if len(progress) > 0 else None)
+
+    def poll(self):
+        """Poll the pending tasks once.
+
+        :return: the full resource of the tasks found final, by href.
+
+        :rtype: dict
+        """
+        finished = {}
+        if len(self.pending) == 1:
+            href = list(self.pending.keys())[0]
+            task = self.client.get_resource(href)
+            self.pending[href] = task
+            if is_task_final(task):
+                finished[href] = task
+            return finished
+        resource_type = ResourceType.TASK.value
+        if self.client.is_sysadmin():
+            resource_type = ResourceType.ADMIN_TASK.value
+        hrefs = list(self.pending.keys())
+        by_id = {task_uuid(href): href for href in hrefs}
+        for n in range(0, len(hrefs), QUERY_BATCH_SIZE):
+            ids = [task_uuid(href) for href in hrefs[n:n + QUERY_BATCH_SIZE]]
+            query = self.client.get_typed_query(
+                resource_type,
+                query_result_format=QueryResultFormat.RECORDS,
+                page_size=len(ids),
+                qfilter=','.join('id==urn:vcloud:task:%s' % i for i in ids))
+            for record in query.execute():
+                href = by_id.get(task_uuid(record.get('href')))
+                if href is None:
+                    continue
+                self.pending[href] = record
+                if is_task_final(record):
+                    finished[href] = self.client.get_resource(href)
+        return finished
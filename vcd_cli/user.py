@@ -12,11 +12,17 @@
 # conditions of the subcomponent's license, as noted in the LICENSE file.
 #
 
+import urllib.parse
+
 import click
+from pyvcloud.vcd.client import QueryResultFormat
+from pyvcloud.vcd.client import ResourceType
 from pyvcloud.vcd.org import Org
 from pyvcloud.vcd.utils import to_dict
 
+from vcd_cli.query import execute_query
 from vcd_cli.utils import restore_session
+from vcd_cli.utils import split_fields
 from vcd_cli.utils import stderr
 from vcd_cli.utils import stdout
 from vcd_cli.vcd import abort_if_false
@@ -248,7 +254,13 @@ def update(ctx, user_name, is_enabled):
     metavar='[org-name]',
     help='name of the org',
 )
-def list_users(ctx, org_name):
+@click.option(
+    '--fields',
+    metavar='<attr,...>',
+    callback=split_fields,
+    default=None,
+    help='Comma separated attributes to fetch and show')
+def list_users(ctx, org_name, fields):
     try:
         restore_session(ctx)
         client = ctx.obj['client']
@@ -256,13 +268,25 @@ def list_users(ctx, org_name):
             org_href = client.get_org_by_name(org_name).get('href')
         else:
             org_href = ctx.obj['profiles'].get('org_href')
-        org = Org(client, href=org_href)
-        users = org.list_users()
+        if client.is_sysadmin():
+            users = execute_query(
+                client,
+                ResourceType.ADMIN_USER.value,
+                query_result_format=QueryResultFormat.RECORDS,
+                qfilter='org==%s' % urllib.parse.quote(org_href),
+                fields=fields)
+        else:
+            users = execute_query(
+                client,
+                ResourceType.USER.value,
+                query_result_format=QueryResultFormat.RECORDS,
+                fields=fields)
         result = []
-        for record in list(users):
+        for record in users:
             result.append(
                 to_dict(
                     record,
+                    attributes=fields,
                     exclude=[
                         'org', 'orgName', 'deployedVMQuotaRank',
                         'storedVMQuotaRank'
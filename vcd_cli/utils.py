@@ -11,19 +11,20 @@
 # code for the these subcomponents is subject to the terms and
 # conditions of the subcomponent's license, as noted in the LICENSE file.
 #
-import collections
+import collections.abc
+import csv
+import io
+import itertools
 import json
 from os import environ
 import re
 import sys
+import threading
 import traceback
 
 import click
 from colorama import Fore
 from lxml.objectify import ObjectifiedElement
-from pygments import formatters
-from pygments import highlight
-from pygments import lexers
 from pyvcloud.vcd.client import Client
 from pyvcloud.vcd.client import EntityType
 from pyvcloud.vcd.client import get_logger
@@ -38,10 +39,27 @@ from pyvcloud.vcd.utils import to_dict
 import requests
 from tabulate import tabulate
 
+from vcd_cli.json_encoder import JsonEncoder
+from vcd_cli.profiles import profile_name
 from vcd_cli.profiles import Profiles
+from vcd_cli.table_writer import TABLE_SAMPLE_SIZE
+from vcd_cli.table_writer import TableWriter
+from vcd_cli.task_events import task_event_listener
+from vcd_cli.task_waiter import PollPolicy
+from vcd_cli.task_waiter import TaskWaiter
 
 LOGGER = get_logger(file_name='vcd_cli_error.log')
 
+# Largest JSON output, in characters, that is highlighted in color.
+HIGHLIGHT_MAX_SIZE = 256 * 1024
+
+# Output formats printed one record per line, as the records come.
+LINE_FORMATS = ['ndjson', 'csv', 'tsv']
+
+# Guards the session of context objects shared by threads, see
+# restore_session.
+_session_lock = threading.Lock()
+
 
 def is_sysadmin(ctx):
     org_name = ctx.obj['profiles'].get('org')
@@ -90,10 +108,30 @@ def as_metavar(values):
     return result
 
 
-def restore_session(ctx, vdc_required=False):
-    if type(ctx.obj) is dict and 'client' in ctx.obj and ctx.obj['client']:
-        return
-    profiles = Profiles.load()
+def split_fields(ctx, param, value):
+    """Click callback turning a comma separated --fields value into a list.
+
+    :return: the attribute names, or None when the option is not given.
+
+    :rtype: list
+    """
+    if value is None:
+        return None
+    fields = [f.strip() for f in value.split(',') if f.strip() != '']
+    if len(fields) == 0:
+        raise click.BadParameter('at least one attribute is required')
+    return fields
+
+
+def create_client(profiles):
+    """Create a client and rehydrate it from the token of a profile.
+
+    :param vcd_cli.profiles.Profiles profiles: the loaded profiles.
+
+    :return: the authenticated client.
+
+    :rtype: pyvcloud.vcd.client.Client
+    """
     token = profiles.get('token')
     if token is None or len(token) == 0:
         raise Exception('Can\'t restore session, please login again.')
@@ -118,18 +156,63 @@ def restore_session(ctx, vdc_required=False):
         log_requests=profiles.get('log_request'),
         log_headers=profiles.get('log_header'),
         log_bodies=profiles.get('log_body'))
-    client.rehydrate_from_token(
-        profiles.get('token'), profiles.get('is_jwt_token'))
+    client.rehydrate_from_token(token, profiles.get('is_jwt_token'))
+    return client
+
 
-    ctx.obj = {}
-    ctx.obj['client'] = client
-    ctx.obj['profiles'] = profiles
+def restore_session(ctx, vdc_required=False):
+    name = profile_name(ctx)
+    # The context object may be shared by commands run one after the other,
+    # or at the same time, e.g. by shell and batch. Its session is reused
+    # when it is one of the same profile and set when there is none, and
+    # each command gets a copy of its own so commands of other profiles
+    # don't change the session under it. The context object is only set
+    # once the session is restored.
+    shared = ctx.obj if type(ctx.obj) is dict else {}
+    with _session_lock:
+        client = shared.get('client')
+        profiles = shared.get('profiles')
+    obj = dict(shared)
+    if client is None or profiles is None or profiles.name != name:
+        profiles = Profiles.load(name=name)
+        client = create_client(profiles)
+        with _session_lock:
+            if shared.get('client') is None:
+                shared['profiles'] = profiles
+                shared['client'] = client
+            elif getattr(shared.get('profiles'), 'name', None) != name:
+                # names resolved for another profile
+                obj.pop('resolution_cache', None)
+    obj['client'] = client
+    obj['profiles'] = profiles
+    ctx.obj = obj
     if vdc_required:
         if not ctx.obj['profiles'].get('vdc_in_use') or \
            not ctx.obj['profiles'].get('vdc_href'):
             raise Exception('select a virtual datacenter')
 
 
+def task_result_text(task):
+    if task.get('status') == TaskStatus.ERROR.value:
+        # TODO(should return != 0)
+        return 'task: %s, result: %s, message: %s' % \
+            (extract_id(task.get('id')), task.get('status'),
+             task.Error.get('message'))
+    return 'task: %s, %s, result: %s' % \
+        (extract_id(task.get('id')), task.get('operation'),
+         task.get('status'))
+
+
+def task_result_dict(task):
+    return {
+        'task': extract_id(task.get('id')),
+        'operation': task.get('operation'),
+        'status': task.get('status'),
+        'message': task.Error.get('message')
+        if hasattr(task, 'Error') else None
+    }
+
+
 def spinning_cursor():
     while True:
         for cursor in '|/-\\':
@@ -159,24 +242,138 @@ def task_callback(task):
     click.secho(message, nl=False)
 
 
+def waiter_callback(waiter):
+    for task in waiter.pending.values():
+        task_callback(task)
+
+
+def poll_policy(ctx):
+    """Build the task poll policy from the options and the profiles file.
+
+    --wait-timeout and --poll-strategy take precedence over the keys
+    'wait_timeout' and 'poll_strategy' of the profiles file.
+
+    :param click.Context ctx: the click context.
+
+    :return: the policy to wait for tasks with.
+
+    :rtype: PollPolicy
+    """
+    root_params = ctx.find_root().params
+    data = {}
+    if isinstance(ctx.obj, dict) and ctx.obj.get('profiles') is not None:
+        data = ctx.obj['profiles'].data or {}
+    strategy = root_params.get('poll_strategy') or \
+        data.get('poll_strategy') or 'adaptive'
+    timeout = root_params.get('wait_timeout')
+    if timeout is None:
+        timeout = data.get('wait_timeout')
+    return PollPolicy(strategy, timeout)
+
+
+def task_waiter(ctx):
+    """Create a TaskWaiter for the session of the context.
+
+    The waiter polls tasks as set by poll_policy() and listens for task
+    events when the profiles file has a 'task_events' section.
+
+    :param click.Context ctx: the click context.
+
+    :rtype: TaskWaiter
+    """
+    events = None
+    if ctx.obj.get('profiles') is not None:
+        events = task_event_listener(ctx.obj['profiles'])
+    return TaskWaiter(ctx.obj['client'], poll_policy(ctx), events)
+
+
+def output_format(ctx):
+    """Get the output format selected with --output or --json.
+
+    :param click.Context ctx: the click context, may be None.
+
+    :return: one of 'table', 'json', 'ndjson', 'csv' or 'tsv'.
+
+    :rtype: str
+    """
+    if ctx is None:
+        return 'table'
+    params = ctx.find_root().params
+    if params.get('output') is not None:
+        return params['output']
+    return 'json' if params.get('json_output') else 'table'
+
+
+def use_colors(ctx):
+    """Tell whether output is colored: colors are on and stdout is a tty."""
+    return bool(ctx.find_root().params.get('is_colorized')) and \
+        sys.stdout.isatty()
+
+
+def json_encoder(ctx):
+    """Create the JSON encoder set up by --compact and --sort-keys.
+
+    :param click.Context ctx: the click context, may be None.
+
+    :rtype: JsonEncoder
+    """
+    params = {} if ctx is None else ctx.find_root().params
+    return JsonEncoder(
+        compact=params.get('compact', False),
+        sort_keys=params.get('sort_keys', True))
+
+
+def highlight_json(text, ctx):
+    """Highlight JSON text in color, when it is worth it.
+
+    Text is left as is when colors are turned off, when the output is not
+    a terminal, or when the text is longer than HIGHLIGHT_MAX_SIZE, as
+    highlighting large documents takes much longer than producing them.
+    pygments is only imported when it is used.
+
+    :param str text: JSON text.
+    :param click.Context ctx: the click context.
+
+    :return: the text to print.
+
+    :rtype: str
+    """
+    if not use_colors(ctx) or len(text) > HIGHLIGHT_MAX_SIZE:
+        return text
+    from pygments import formatters
+    from pygments import highlight
+    from pygments import lexers
+    return highlight(text, lexers.JsonLexer(), formatters.TerminalFormatter())
+
+
 def stdout(obj, ctx=None, alt_text=None, show_id=False, sort_headers=True):
     global last_message
     last_message = ''
     o = obj
-    if ctx is not None and \
-       'json_output' in ctx.find_root().params and \
-       ctx.find_root().params['json_output']:
+    fmt = output_format(ctx)
+    if fmt in LINE_FORMATS or isinstance(obj, collections.abc.Iterator):
+        rows = None
+        if isinstance(obj, str):
+            rows = [{'message': obj}]
+        elif isinstance(obj, dict) and 'task_href' not in obj:
+            rows = [obj]
+        elif isinstance(obj, (list, collections.abc.Iterator)):
+            rows = (to_dict(r) if isinstance(r, ObjectifiedElement) else r
+                    for r in obj)
+        if rows is not None and fmt != 'json':
+            stdout_stream(rows, ctx, show_id=show_id)
+            return
+        if rows is not None and isinstance(obj, collections.abc.Iterator):
+            o = list(rows)
+    if fmt == 'json':
         if isinstance(obj, str):
             o = {'message': obj}
-        text = json.dumps(o, sort_keys=True, indent=4, separators=(',', ': '))
-        if sys.version_info[0] < 3:
-            text = str(text, 'utf-8')
-        if ctx.find_root().params['is_colorized']:
-            click.echo(
-                highlight(text, lexers.JsonLexer(),
-                          formatters.TerminalFormatter()))
+        encoder = json_encoder(ctx)
+        if use_colors(ctx):
+            click.echo(highlight_json(encoder.dumps(o), ctx))
         else:
-            click.echo(text)
+            encoder.write(o, click.get_text_stream('stdout'))
+            click.echo('')
     else:
         if alt_text is not None:
             text = alt_text
@@ -192,28 +389,10 @@ def stdout(obj, ctx=None, alt_text=None, show_id=False, sort_headers=True):
                        ctx.find_root().params['no_wait']:
                         text = as_prop_value_list(obj, show_id=show_id)
                     else:
-                        client = ctx.obj['client']
-                        task = client.get_task_monitor().wait_for_status(
-                            task=obj,
-                            timeout=60,
-                            poll_frequency=5,
-                            fail_on_statuses=None,
-                            expected_target_statuses=[
-                                TaskStatus.SUCCESS, TaskStatus.ABORTED,
-                                TaskStatus.ERROR, TaskStatus.CANCELED
-                            ],
-                            callback=task_callback)
-                        if task.get('status') == TaskStatus.ERROR.value:
-                            text = 'task: %s, result: %s, message: %s' % \
-                                   (extract_id(task.get('id')),
-                                    task.get('status'),
-                                    task.Error.get('message'))
-                            # TODO(should return != 0)
-                        else:
-                            text = 'task: %s, %s, result: %s' % \
-                                   (extract_id(task.get('id')),
-                                    task.get('operation'),
-                                    task.get('status'))
+                        waiter = task_waiter(ctx)
+                        waiter.add(obj)
+                        task = next(waiter.wait(waiter_callback))
+                        text = task_result_text(task)
                 elif ctx.command.name == 'list' and \
                         isinstance(obj, collections.Iterable):
                     text = as_table(obj)
@@ -244,6 +423,136 @@ def stdout(obj, ctx=None, alt_text=None, show_id=False, sort_headers=True):
         click.echo('\x1b[2K\r' + text)
 
 
+def stdout_tasks(tasks, ctx):
+    """Wait for several tasks together and print the result of each.
+
+    The tasks are waited for by a TaskWaiter, which polls them together
+    with batched task queries, while a single line shows how many of them
+    are complete; then one result line is printed per task, in the order of
+    the tasks given.
+
+    :param list tasks: task resources, e.g. as returned by power operations.
+    :param click.Context ctx: the click context.
+    """
+    root_params = ctx.find_root().params
+    if len(tasks) == 1 or root_params.get('no_wait'):
+        for task in tasks:
+            stdout(task, ctx)
+        return
+    waiter = task_waiter(ctx)
+    for task in tasks:
+        waiter.add(task)
+
+    def progress(waiter):
+        click.secho(
+            '\x1b[2K\r%s of %s tasks complete %s ' %
+            (waiter.complete, waiter.total, next(spinner)),
+            nl=False)
+
+    finished = {task.get('href'): task for task in waiter.wait(progress)}
+    results = [finished[task.get('href')] for task in tasks]
+    if output_format(ctx) != 'table':
+        stdout([task_result_dict(task) for task in results], ctx)
+    else:
+        stdout('\n'.join(task_result_text(task) for task in results), ctx)
+
+
+def stdout_stream(items, ctx, show_id=False, sample_size=TABLE_SAMPLE_SIZE):
+    """Print dicts as they come, without holding them all in memory.
+
+    With --json or --output ndjson, each dict is printed as one line of
+    JSON. With --output csv or tsv, each dict is printed as one row, below
+    a header row. Otherwise the dicts are printed as a table by a
+    TableWriter, which measures the columns on the first sample_size dicts,
+    or uses the width set by --column-width. The headers of csv, tsv and
+    tables are taken from the first dict, and are left out with
+    --no-header.
+
+    :param items: iterable of dicts, e.g. a generator over query records.
+    :param click.Context ctx: the click context.
+    :param bool show_id: show the 'id' column of tables.
+    :param int sample_size: number of rows the table columns are measured
+        on.
+
+    :return: the number of dicts printed.
+
+    :rtype: int
+    """
+    count = 0
+    fmt = output_format(ctx)
+    params = ctx.find_root().params
+    show_header = not params.get('no_header', False)
+    if fmt in ['json', 'ndjson']:
+        encoder = JsonEncoder(
+            compact=True, sort_keys=params.get('sort_keys', True))
+        for item in items:
+            click.echo(encoder.dumps(item))
+            count += 1
+        return count
+    if fmt in ['csv', 'tsv']:
+        return write_delimited(items, ',' if fmt == 'csv' else '\t',
+                               show_id, show_header)
+    items = iter(items)
+    first = next(items, None)
+    if first is None:
+        return 0
+    headers = stream_headers(first, show_id)
+    writer = TableWriter(
+        headers,
+        sample_size=sample_size,
+        column_width=params.get('column_width'),
+        show_header=show_header)
+    for line in writer.lines([item.get(k) for k in headers]
+                             for item in itertools.chain([first], items)):
+        click.echo(line)
+        count += 1
+    return count - (2 if show_header else 0)
+
+
+def stream_headers(item, show_id=False):
+    return [
+        k for k in sorted(item.keys())
+        if k not in ['href', 'type'] and (show_id or k != 'id')
+    ]
+
+
+def write_delimited(items, delimiter, show_id=False, show_header=True):
+    """Print dicts as delimiter separated rows, one line at a time.
+
+    :param items: iterable of dicts.
+    :param str delimiter: ',' for csv, '\\t' for tsv.
+    :param bool show_id: include the 'id' column.
+    :param bool show_header: print the header row.
+
+    :return: the number of dicts printed.
+
+    :rtype: int
+    """
+    line = io.StringIO()
+    writer = csv.writer(line, delimiter=delimiter, lineterminator='\n')
+    headers = None
+    count = 0
+    for item in items:
+        if headers is None:
+            headers = stream_headers(item, show_id)
+            if show_header:
+                writer.writerow(headers)
+        writer.writerow([cell_text(item.get(k)) for k in headers])
+        click.echo(line.getvalue(), nl=False)
+        line.seek(0)
+        line.truncate()
+        count += 1
+    return count
+
+
+def cell_text(value):
+    if value is None:
+        return ''
+    if isinstance(value, (list, tuple, dict)):
+        return json.dumps(value, sort_keys=True)
+    return str(value)
+
+
 def stderr(exception, ctx=None):
     try:
         LOGGER.error(traceback.format_exc())
@@ -261,18 +570,16 @@ def stderr(exception, ctx=None):
         message = exception.message
     else:
         message = str(exception)
-    if ctx is not None and ctx.find_root().params['json_output']:
+    if output_format(ctx) in ['json', 'ndjson']:
         message = {'error': str(message)}
-        text = json.dumps(
-            message, sort_keys=True, indent=4, separators=(',', ': '))
+        if output_format(ctx) == 'ndjson':
+            text = json.dumps(message)
+        else:
+            text = json.dumps(
+                message, sort_keys=True, indent=4, separators=(',', ': '))
         if sys.version_info[0] < 3:
             text = str(text, 'utf-8')
-        if ctx.find_root().params['is_colorized']:
-            message = highlight(text, lexers.JsonLexer(),
-                                formatters.TerminalFormatter())
-        else:
-            message = text
-        click.echo(message)
+        click.echo(highlight_json(text, ctx))
         sys.exit(1)
     else:
         click.echo('\x1b[2K\r', nl=False)
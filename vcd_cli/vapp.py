@@ -12,31 +12,46 @@
 # conditions of the subcomponent's license, as noted in the LICENSE file.
 #
 
+from concurrent.futures import as_completed
+from concurrent.futures import ThreadPoolExecutor
+import itertools
 import os
 import click
 from pyvcloud.vcd.client import ApiVersion
 from pyvcloud.vcd.client import EntityType
 from pyvcloud.vcd.client import get_links
+from pyvcloud.vcd.client import QueryResultFormat
 from pyvcloud.vcd.client import ResourceType
 from pyvcloud.vcd.org import Org
 from pyvcloud.vcd.utils import access_settings_to_dict
+from pyvcloud.vcd.utils import filter_attributes
 from pyvcloud.vcd.utils import to_dict
 from pyvcloud.vcd.utils import vapp_to_dict
 from pyvcloud.vcd.vapp import VApp
 from pyvcloud.vcd.vdc import VDC
 from pyvcloud.vcd.vm import VM
 
+from vcd_cli.cache import invalidate
+from vcd_cli.cache import resolve_resource
+from vcd_cli.inventory import snapshot_records
+from vcd_cli.query import execute_query
 from vcd_cli.utils import access_settings_to_list
 from vcd_cli.utils import acl_str_to_list_of_dict
 from vcd_cli.utils import extract_name_and_id
 from vcd_cli.utils import is_sysadmin
 from vcd_cli.utils import restore_session
+from vcd_cli.utils import split_fields
 from vcd_cli.utils import stderr
 from vcd_cli.utils import stdout
+from vcd_cli.utils import stdout_tasks
 from vcd_cli.vcd import abort_if_false
 from vcd_cli.vcd import vcd
 
 
+# Maximum number of VMs an operation is started on at a time.
+VM_OPERATION_WORKERS = 8
+
+
 @vcd.group(short_help='manage vApps')
 @click.pass_context
 def vapp(ctx):
@@ -64,7 +79,8 @@ def vapp(ctx):
 \b
     Examples
         vcd vapp list
-            Get list of vApps in current virtual datacenter.
+            Get list of vApps in all the virtual datacenters of
+            the user, not only the current one.
 
 \b
         vcd vapp list vapp1
@@ -382,12 +398,26 @@ def detach(ctx, vapp_name, vm_name, disk_name):
 @click.pass_context
 @click.argument('name', metavar='<vapp-name>', default=None, required=False)
 @click.option('--filter', 'filter', metavar='<filter>', help='filter for vapp')
-def list_vapps(ctx, name, filter):
+@click.option(
+    '-i',
+    '--inventory',
+    'from_inventory',
+    is_flag=True,
+    default=False,
+    help='Serve from the local inventory snapshot, updated first')
+@click.option(
+    '--fields',
+    metavar='<attr,...>',
+    callback=split_fields,
+    default=None,
+    help='Comma separated attributes to fetch and show')
+def list_vapps(ctx, name, filter, from_inventory, fields):
     try:
         restore_session(ctx, vdc_required=True)
         client = ctx.obj['client']
-        result = []
-        records = []
+        if from_inventory:
+            list_vapps_from_inventory(ctx, name, filter, fields)
+            return
         if name is None:
             if is_sysadmin(ctx):
                 resource_type = ResourceType.ADMIN_VAPP.value
@@ -415,28 +445,61 @@ def list_vapps(ctx, name, filter):
                     'numberOfCpus', 'numberOfVMs', 'ownerName', 'status',
                     'storageKB', 'vdcName'
                 ]
-
-        vdc_href = ctx.obj['profiles'].get('vdc_href')
-        vdc = VDC(client, href=vdc_href)
-        records = vdc.list_vapp_details(resource_type, filter)
-
-        if len(records) == 0:
+        if fields is not None:
+            attributes = fields
+
+        records = execute_query(
+            client,
+            resource_type,
+            query_result_format=QueryResultFormat.RECORDS,
+            qfilter=filter,
+            fields=fields)
+        # with --fields, the default attributes of the type are left out
+        shown_type = resource_type if fields is None else None
+        result = (to_dict(r, resource_type=shown_type, attributes=attributes)
+                  for r in records)
+        # rows are printed as the pages of records are fetched
+        first = next(result, None)
+        if first is None:
             if name is None:
-                result = 'No vApps were found.'
+                stdout('No vApps were found.', ctx)
             else:
-                result = 'No vms were found.'
-
+                stdout('No vms were found.', ctx)
         else:
-            for r in records:
-                result.append(
-                    to_dict(
-                        r, resource_type=resource_type, attributes=attributes))
-
-            stdout(result, ctx, show_id=False)
+            stdout(itertools.chain([first], result), ctx, show_id=False)
     except Exception as e:
         stderr(e, ctx)
 
 
+def list_vapps_from_inventory(ctx, name, filter, fields=None):
+    """List vApps, or the VMs of a vApp, from the inventory snapshot.
+
+    As with the live queries of vapp list, the vApps of every vDC visible
+    to the session are listed, not only the ones of the vDC in use.
+    """
+    if filter is not None:
+        raise Exception('--filter can\'t be served from the inventory')
+    if name is None:
+        resource_type, records = snapshot_records(ctx, 'vapp')
+        attributes = filter_attributes(resource_type)
+        if len(records) == 0:
+            stdout('No vApps were found.', ctx)
+            return
+    else:
+        resource_type, records = snapshot_records(
+            ctx, 'vm', filters=[('containerName', name)])
+        attributes = [
+            'name', 'containerName', 'ipAddress', 'status', 'memoryMB',
+            'numberOfCpus'
+        ]
+        if len(records) == 0:
+            stdout('No vms were found.', ctx)
+            return
+    attributes = fields or attributes
+    stdout([{k: r.get(k) for k in attributes} for r in records], ctx,
+           show_id=False)
+
+
 @vapp.command(short_help='create a vApp')
 @click.pass_context
 @click.argument('name', metavar='<name>', required=True)
@@ -571,10 +634,13 @@ def delete(ctx, name, vm_names, force):
         vdc = VDC(client, href=vdc_href)
         if len(vm_names) == 0:
             task = vdc.delete_vapp(name, force)
+            invalidate(ctx, 'vapp', vdc_href, name)
         else:
             vapp_resource = vdc.get_vapp(name)
             vapp = VApp(client, resource=vapp_resource)
             task = vapp.delete_vms(vm_names)
+            for vm_name in vm_names:
+                invalidate(ctx, 'vm', vdc_href, name, vm_name)
         stdout(task, ctx)
     except Exception as e:
         stderr(e, ctx)
@@ -645,11 +711,9 @@ def reboot(ctx, name, vm_names):
             task = vapp.reboot()
             stdout(task, ctx)
         else:
-            for vm_name in vm_names:
-                vm = VM(client, href=vapp.get_vm(vm_name).get('href'))
-                vm.reload()
-                task = vm.reboot()
-                stdout(task, ctx)
+            tasks = vm_tasks(
+                ctx, vapp, vm_names, lambda vm: vm.reboot(), reload=True)
+            stdout_tasks(tasks, ctx)
     except Exception as e:
         stderr(e, ctx)
 
@@ -677,10 +741,8 @@ def power_off(ctx, name, vm_names):
             task = vapp.power_off()
             stdout(task, ctx)
         else:
-            for vm_name in vm_names:
-                vm = VM(client, resource=vapp.get_vm(vm_name))
-                task = vm.power_off()
-                stdout(task, ctx)
+            tasks = vm_tasks(ctx, vapp, vm_names, lambda vm: vm.power_off())
+            stdout_tasks(tasks, ctx)
     except Exception as e:
         stderr(e, ctx)
 
@@ -708,10 +770,9 @@ def reset(ctx, name, vm_names):
             task = vapp.power_reset()
             stdout(task, ctx)
         else:
-            for vm_name in vm_names:
-                vm = VM(client, resource=vapp.get_vm(vm_name))
-                task = vm.power_reset()
-                stdout(task, ctx)
+            tasks = vm_tasks(ctx, vapp, vm_names,
+                             lambda vm: vm.power_reset())
+            stdout_tasks(tasks, ctx)
     except Exception as e:
         stderr(e, ctx)
 
@@ -746,12 +807,15 @@ def deploy(ctx, name, vm_names, power_on, force_customization):
             task = vapp.deploy(power_on=power_on)
             stdout(task, ctx)
         else:
-            for vm_name in vm_names:
-                vm = VM(client, href=vapp.get_vm(vm_name).get('href'))
-                vm.reload()
-                task = vm.deploy(
-                    power_on=power_on, force_customization=force_customization)
-                stdout(task, ctx)
+            tasks = vm_tasks(
+                ctx,
+                vapp,
+                vm_names,
+                lambda vm: vm.deploy(
+                    power_on=power_on,
+                    force_customization=force_customization),
+                reload=True)
+            stdout_tasks(tasks, ctx)
     except Exception as e:
         stderr(e, ctx)
 
@@ -785,11 +849,10 @@ def undeploy(ctx, name, vm_names, action):
             task = vapp.undeploy(action)
             stdout(task, ctx)
         else:
-            for vm_name in vm_names:
-                vm = VM(client, href=vapp.get_vm(vm_name).get('href'))
-                vm.reload()
-                task = vm.undeploy(action)
-                stdout(task, ctx)
+            tasks = vm_tasks(
+                ctx, vapp, vm_names, lambda vm: vm.undeploy(action),
+                reload=True)
+            stdout_tasks(tasks, ctx)
     except Exception as e:
         stderr(e, ctx)
 
@@ -823,11 +886,8 @@ def power_on(ctx, name, vm_names):
             task = vapp.power_on()
             stdout(task, ctx)
         else:
-            for vm_name in vm_names:
-                vm = VM(client, resource=vapp.get_vm(vm_name))
-                task = vm.power_on()
-                stdout(task, ctx)
-        stdout(task, ctx)
+            tasks = vm_tasks(ctx, vapp, vm_names, lambda vm: vm.power_on())
+            stdout_tasks(tasks, ctx)
     except Exception as e:
         stderr(e, ctx)
 
@@ -855,11 +915,9 @@ def shutdown(ctx, name, vm_names):
             task = vapp.shutdown()
             stdout(task, ctx)
         else:
-            for vm_name in vm_names:
-                vm = VM(client, href=vapp.get_vm(vm_name).get('href'))
-                vm.reload()
-                task = vm.shutdown()
-                stdout(task, ctx)
+            tasks = vm_tasks(
+                ctx, vapp, vm_names, lambda vm: vm.shutdown(), reload=True)
+            stdout_tasks(tasks, ctx)
     except Exception as e:
         stderr(e, ctx)
 
@@ -1108,8 +1166,9 @@ def use(ctx, name):
         vdc = VDC(client, href=vdc_href)
         vapp_resource = vdc.get_vapp(name)
         vapp = VApp(client, resource=vapp_resource)
-        ctx.obj['profiles'].set('vapp_in_use', str(name))
-        ctx.obj['profiles'].set('vapp_href', str(vapp.href))
+        with ctx.obj['profiles'].transaction():
+            ctx.obj['profiles'].set('vapp_in_use', str(name))
+            ctx.obj['profiles'].set('vapp_href', str(vapp.href))
         message = 'now using org: \'%s\', vdc: \'%s\', vApp: \'%s\'.' % \
                   (in_use_org_name, in_use_vdc_name, name)
         stdout({
@@ -1385,6 +1444,9 @@ def update_vapp(ctx, vapp_name, name, description):
         vapp = get_vapp(ctx, vapp_name)
 
         task = vapp.edit_name_and_description(name, description)
+        if name is not None:
+            invalidate(ctx, 'vapp', ctx.obj['profiles'].get('vdc_href'),
+                       vapp_name)
         stdout(task, ctx)
     except Exception as e:
         stderr(e, ctx)
@@ -1473,6 +1535,8 @@ def move_to(ctx, vapp_name, vdc):
         if vdc_href is not None:
             vapp = get_vapp(ctx, vapp_name)
             task = vapp.move_to(vdc_href)
+            invalidate(ctx, 'vapp', ctx.obj['profiles'].get('vdc_href'),
+                       vapp_name)
             stdout(task, ctx)
         else:
             stdout('Org vdc not found', ctx)
@@ -1875,8 +1939,64 @@ def add_vm_scratch(ctx, name, vm_name, computer_name, description, os_type,
         stderr(e, ctx)
 
 
+def vm_tasks(ctx, vapp, vm_names, operation, reload=False):
+    """Start an operation on several VMs of a vApp concurrently.
+
+    :param click.Context ctx: the click context.
+    :param pyvcloud.vcd.vapp.VApp vapp: the vApp containing the VMs.
+    :param list vm_names: names of the VMs.
+    :param function operation: function taking a VM and returning the task
+        of the operation started on it, e.g. lambda vm: vm.power_on().
+    :param bool reload: fetch each VM before starting the operation instead
+        of using its representation in the vApp.
+
+    :return: the tasks, in the order of vm_names.
+
+    :rtype: list
+
+    :raises Exception: if the operation could not be started on some of
+        the VMs, once the tasks started on the others are done; the message
+        lists every failure.
+    """
+    client = ctx.obj['client']
+
+    def start(vm_name):
+        if reload:
+            vm = VM(client, href=vapp.get_vm(vm_name).get('href'))
+            vm.reload()
+        else:
+            vm = VM(client, resource=vapp.get_vm(vm_name))
+        return operation(vm)
+
+    tasks = {}
+    errors = {}
+    workers = min(VM_OPERATION_WORKERS, len(vm_names))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {
+            executor.submit(start, vm_name): i
+            for i, vm_name in enumerate(vm_names)
+        }
+        for future in as_completed(futures):
+            try:
+                tasks[futures[future]] = future.result()
+            except Exception as e:
+                errors[futures[future]] = e
+    tasks = [tasks[i] for i in sorted(tasks)]
+    if len(errors) == 0:
+        return tasks
+    if len(tasks) > 0:
+        stdout_tasks(tasks, ctx)
+    raise Exception('Could not start the operation on %s of %s VMs: %s' %
+                    (len(errors), len(vm_names), '; '.join(
+                        '%s: %s' % (vm_names[i], errors[i])
+                        for i in sorted(errors))))
+
+
 def get_vapp(ctx, vapp_name):
     client = ctx.obj['client']
     vdc_href = ctx.obj['profiles'].get('vdc_href')
-    vdc = VDC(client, href=vdc_href)
-    return VApp(client, resource=vdc.get_vapp(vapp_name))
+    return VApp(
+        client,
+        resource=resolve_resource(
+            ctx, ('vapp', vdc_href, vapp_name),
+            lambda: VDC(client, href=vdc_href).get_vapp_href(vapp_name)))
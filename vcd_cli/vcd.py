@@ -12,27 +12,210 @@
 # conditions of the subcomponent's license, as noted in the LICENSE file.
 #
 
+import importlib
 import platform
+import sys
 
 import click
 from colorama import init
-import pkg_resources
 
+from vcd_cli.daemon_client import forward
+from vcd_cli.daemon_client import should_forward
+from vcd_cli.manifest import command_from_manifest
+from vcd_cli.manifest import get_manifest
 from vcd_cli.plugin import load_user_plugins
-from vcd_cli.utils import stdout
 
 CONTEXT_SETTINGS = dict(help_option_names=['-h', '--help'])
 
+# Modules implementing each top level command, in import order. Only the
+# modules of the command being invoked are imported, which keeps the start
+# up cost of vcd independent of the number of command modules.
+COMMAND_MODULES = {
+    'batch': ['batch'],
+    'catalog': ['catalog'],
+    'daemon': ['daemon'],
+    'datastore': ['datastore'],
+    'disk': ['disk'],
+    'gateway': [
+        'gateway', 'ca_certificates', 'crl_certificates', 'dhcp_pool',
+        'firewall_rule', 'ipsec_vpn', 'nat_rule', 'service_certificates',
+        'static_route'
+    ],
+    'info': ['info'],
+    'inventory': ['inventory'],
+    'login': ['login'],
+    'logout': ['login'],
+    'netpool': ['netpool'],
+    'network': ['network', 'routed'],
+    'nsxt': ['nsxt'],
+    'org': ['org'],
+    'profile': ['profile'],
+    'pvdc': ['pvdc'],
+    'pwd': ['profile'],
+    'right': ['right'],
+    'role': ['role'],
+    'search': ['search'],
+    'shell': ['shell'],
+    'system': ['system'],
+    'task': ['task'],
+    'user': ['user'],
+    'vapp': [
+        'vapp', 'vapp_network', 'vapp_network_dhcp', 'vapp_network_firewall',
+        'vapp_network_nat', 'vapp_network_static_route'
+    ],
+    'vc': ['vc'],
+    'vdc': ['vdc'],
+    'vm': ['vm'],
+}
+
+
+def subcommand_args(ctx):
+    """Return the arguments left for the subcommand of a parsed group."""
+    # protected_args is deprecated since click 8.2
+    protected_args = getattr(ctx, '_protected_args', None)
+    if protected_args is None:
+        protected_args = ctx.protected_args
+    return list(protected_args) + list(ctx.args)
+
+
+class LazyGroup(click.Group):
+    """Click group that imports the module of a subcommand on first use.
+
+    Command modules register themselves with the group as a side effect of
+    being imported (@vcd.group, @vcd.command), so resolving a command name
+    only needs to import the modules listed for it in the lazy command map.
+    Commands added directly, e.g. by extensions, are served as usual.
+
+    Help listings and shell completion only need names, help and params, so
+    they are served from the command manifest without importing anything.
+    """
+
+    def __init__(self, *args, **kwargs):
+        self.lazy_commands = kwargs.pop('lazy_commands', {})
+        self.listing = False
+        super(LazyGroup, self).__init__(*args, **kwargs)
+
+    def main(self, args=None, *margs, **kwargs):
+        # When run from the command line, hand the command over to the
+        # session daemon if it is running.
+        if args is None and kwargs.get('standalone_mode', True):
+            args = sys.argv[1:]
+            if should_forward(self.command_name(args), args):
+                exit_code = forward(args)
+                if exit_code is not None:
+                    sys.exit(exit_code)
+        return super(LazyGroup, self).main(args, *margs, **kwargs)
+
+    def root_context(self, args):
+        """Parse the root options of a command line.
+
+        Nothing is run and no command module is imported.
+
+        :param list args: command line arguments, without the leading
+            'vcd'.
+
+        :return: the context of the root group, with the root options in
+            its params, or None if they can't be parsed.
+
+        :rtype: click.Context
+        """
+        try:
+            return self.make_context(
+                'vcd', list(args), resilient_parsing=True)
+        except Exception:
+            return None
+
+    def command_name(self, args):
+        """Return the name of the command a command line runs.
+
+        :param list args: command line arguments, without the leading
+            'vcd'.
+
+        :return: name of the top level command, None if there is none or
+            the root options can't be parsed.
+
+        :rtype: str
+        """
+        ctx = self.root_context(args)
+        if ctx is None:
+            return None
+        args = subcommand_args(ctx)
+        return args[0] if len(args) > 0 else None
+
+    def command_path(self, args):
+        """Return the names of the commands a command line runs.
+
+        The command line is parsed down to the command it invokes, e.g.
+        ['vapp', 'delete'] for 'vcd vapp delete vapp1 --yes'. Nothing is
+        run, the subcommands are looked up as for shell completion.
+
+        :param list args: command line arguments, without the leading
+            'vcd'.
+
+        :return: names of the commands, from the top level one, as far as
+            the command line can be parsed.
+
+        :rtype: list
+        """
+        path = []
+        ctx = self.root_context(args)
+        while ctx is not None and isinstance(ctx.command, click.Group):
+            args = subcommand_args(ctx)
+            if len(args) == 0:
+                break
+            command = ctx.command.get_command(ctx, args[0])
+            if command is None:
+                break
+            path.append(args[0])
+            try:
+                ctx = command.make_context(
+                    args[0], args[1:], parent=ctx, resilient_parsing=True)
+            except Exception:
+                break
+        return path
+
+    def list_commands(self, ctx):
+        return sorted(set(self.commands.keys()) | set(self.lazy_commands))
+
+    def get_command(self, ctx, cmd_name):
+        if cmd_name not in self.commands and \
+                cmd_name in self.lazy_commands:
+            if self.listing or (ctx is not None and ctx.resilient_parsing):
+                entry = get_manifest(self)['command']['commands'].get(
+                    cmd_name)
+                if entry is not None:
+                    return command_from_manifest(entry)
+            for module in self.lazy_commands[cmd_name]:
+                importlib.import_module('vcd_cli.' + module)
+        return self.commands.get(cmd_name)
+
+    def format_commands(self, ctx, formatter):
+        self.listing = True
+        try:
+            super(LazyGroup, self).format_commands(ctx, formatter)
+        finally:
+            self.listing = False
+
 
 def abort_if_false(ctx, param, value):
     if not value:
         ctx.abort()
 
 
-@click.group(context_settings=CONTEXT_SETTINGS, invoke_without_command=True)
+@click.group(
+    cls=LazyGroup,
+    lazy_commands=COMMAND_MODULES,
+    context_settings=CONTEXT_SETTINGS,
+    invoke_without_command=True)
 @click.pass_context
 @click.option(
     '-d', '--debug', is_flag=True, default=False, help='Enable debug')
+@click.option(
+    '--profile',
+    metavar='<name>',
+    envvar='VCD_PROFILE',
+    default=None,
+    help='Profile to use, as saved by \'vcd login\'')
 @click.option(
     '-j',
     '--json',
@@ -40,19 +223,57 @@ def abort_if_false(ctx, param, value):
     is_flag=True,
     default=False,
     help='Results as JSON object')
+@click.option(
+    '--output',
+    type=click.Choice(['table', 'json', 'ndjson', 'csv', 'tsv']),
+    default=None,
+    help='Output format, --json is the same as --output json')
+@click.option(
+    '--compact',
+    is_flag=True,
+    default=False,
+    help='JSON without indentation, encoded faster')
+@click.option(
+    '--sort-keys/--no-sort-keys',
+    default=True,
+    help='Sort the keys of JSON objects')
+@click.option(
+    '--no-header',
+    is_flag=True,
+    default=False,
+    help='Leave out the header of streamed tables, csv and tsv')
+@click.option(
+    '--column-width',
+    metavar='<n>',
+    type=click.IntRange(min=1),
+    default=None,
+    help='Fixed width of the columns of streamed tables')
 @click.option(
     '-n',
     '--no-wait',
     is_flag=True,
     default=False,
     help='Don\'t wait for task')
+@click.option(
+    '--wait-timeout',
+    metavar='<seconds>',
+    type=click.FloatRange(min=0),
+    default=None,
+    help='Stop waiting for tasks after this time, 0 to wait until done')
+@click.option(
+    '--poll-strategy',
+    type=click.Choice(['fixed', 'exponential', 'adaptive']),
+    default=None,
+    help='How often to poll tasks while waiting')
 @click.option(
     '--colorized/--no-colorized',
     'is_colorized',
     default=True,
     envvar='VCD_USE_COLORED_OUTPUT',
     help='print info in color or monochrome')
-def vcd(ctx, debug, json_output, no_wait, is_colorized):
+def vcd(ctx, debug, profile, json_output, output, compact, sort_keys,
+        no_header, column_width, no_wait, wait_timeout, poll_strategy,
+        is_colorized):
     """VMware vCloud Director Command Line Interface.
 
 \b
@@ -62,6 +283,31 @@ def vcd(ctx, debug, json_output, no_wait, is_colorized):
             the command vcd info will print the output in color. The effect
             of the environment variable will be overridden by the param
             --colorized/--no-colorized.
+\b
+        VCD_PROFILE
+            Name of the profile to use, as --profile does. Each profile
+            holds its own session, and its own name resolution cache and
+            inventory snapshot, so commands of different profiles can run
+            at the same time. The default profile is named 'default'.
+\b
+    Task Polling
+        With the adaptive strategy, the default, tasks are polled every
+        200 ms at first and then less often, following the progress they
+        report. exponential starts the same way and doubles the interval
+        after every poll; fixed polls every 5 seconds. Defaults for
+        --wait-timeout and --poll-strategy can be set with the keys
+        'wait_timeout' and 'poll_strategy' in ~/.vcd-cli/profiles.yaml.
+\b
+    Output Formats
+        Results are shown as tables by default. json prints one JSON
+        document; ndjson prints one JSON object per line, and csv and tsv
+        one row per line after a header row, as records are produced.
+        With --compact, JSON is printed without indentation and encoded
+        by orjson when it is installed (pip install vcd-cli[fast-json]).
+        Long listings, such as the ones of search and vapp list, are
+        printed as tables while they are fetched: the column widths are
+        measured on the first rows, or set with --column-width, and longer
+        values are truncated.
      """
     if ctx.invoked_subcommand is None:
         click.secho(ctx.get_help())
@@ -72,6 +318,8 @@ def vcd(ctx, debug, json_output, no_wait, is_colorized):
 @click.pass_context
 def version(ctx):
     """Show vcd-cli version"""
+    import pkg_resources
+    from vcd_cli.utils import stdout
     ver = pkg_resources.require("vcd-cli")[0].version
     ver_obj = {
         'product': 'vcd-cli',
@@ -84,12 +332,12 @@ def version(ctx):
     stdout(ver_obj, ctx, ver_str)
 
 
-def print_command(cmd, level=0):
+def print_command(entry, level=0):
     click.echo(' ' + (' ' * level * 2) + ' ', nl=False)
-    click.echo(cmd.name)
-    if type(cmd) == click.core.Group:
-        for k in sorted(cmd.commands.keys()):
-            print_command(cmd.commands[k], level + 1)
+    click.echo(entry['name'])
+    if entry['commands'] is not None:
+        for k in sorted(entry['commands'].keys()):
+            print_command(entry['commands'][k], level + 1)
 
 
 @vcd.command(short_help='show help')
@@ -99,7 +347,7 @@ def print_command(cmd, level=0):
 def help(ctx, tree):
     """Show vcd-cli help"""
     if tree:
-        print_command(ctx.parent.command)
+        print_command(get_manifest(ctx.parent.command)['command'])
     else:
         click.secho(ctx.parent.get_help())
 
@@ -108,40 +356,4 @@ if __name__ == '__main__':
     vcd()
 else:
     load_user_plugins()
-    from vcd_cli import catalog  # NOQA
-    from vcd_cli import ca_certificates  # NOQA
-    from vcd_cli import crl_certificates  # NOQA
-    from vcd_cli import datastore  # NOQA
-    from vcd_cli import disk  # NOQA
-    from vcd_cli import dhcp_pool  # NOQA
-    from vcd_cli import firewall_rule  # NOQA
-    from vcd_cli import ipsec_vpn  # NOQA
-    from vcd_cli import gateway  # NOQA
-    from vcd_cli import info  # NOQA
-    from vcd_cli import login  # NOQA
-    from vcd_cli import nat_rule  # NOQA
-    from vcd_cli import netpool  # NOQA
-    from vcd_cli import network  # NOQA
-    from vcd_cli import nsxt  # NOQA
-    from vcd_cli import org  # NOQA
-    from vcd_cli import profile  # NOQA
-    from vcd_cli import pvdc  # NOQA
-    from vcd_cli import role  # NOQA
-    from vcd_cli import right  # NOQA
-    from vcd_cli import routed  # NOQA
-    from vcd_cli import static_route  # NOQA
-    from vcd_cli import search  # NOQA
-    from vcd_cli import service_certificates  # NOQA
-    from vcd_cli import system  # NOQA
-    from vcd_cli import task  # NOQA
-    from vcd_cli import user  # NOQA
-    from vcd_cli import vapp  # NOQA
-    from vcd_cli import vapp_network  # NOQA
-    from vcd_cli import vapp_network_dhcp  # NOQA
-    from vcd_cli import vapp_network_firewall  # NOQA
-    from vcd_cli import vapp_network_nat  # NOQA
-    from vcd_cli import vapp_network_static_route  # NOQA
-    from vcd_cli import vc  # NOQA
-    from vcd_cli import vdc  # NOQA
-    from vcd_cli import vm  # NOQA
     init(autoreset=True)
@@ -161,10 +161,11 @@ def use(ctx, name):
                         vapp_in_use = ''
                         vapp_href = ''
                         client.get_resource(link.href)
-                        ctx.obj['profiles'].set('vdc_in_use', vdc_in_use)
-                        ctx.obj['profiles'].set('vdc_href', str(link.href))
-                        ctx.obj['profiles'].set('vapp_in_use', vapp_in_use)
-                        ctx.obj['profiles'].set('vapp_href', vapp_href)
+                        with ctx.obj['profiles'].transaction():
+                            ctx.obj['profiles'].set('vdc_in_use', vdc_in_use)
+                            ctx.obj['profiles'].set('vdc_href', str(link.href))
+                            ctx.obj['profiles'].set('vapp_in_use', vapp_in_use)
+                            ctx.obj['profiles'].set('vapp_href', vapp_href)
                         message = 'now using org: \'%s\', vdc: \'%s\', vApp:' \
                                   ' \'%s\'.' % (in_use_org_name, vdc_in_use,
                                                 vapp_in_use)
@@ -301,10 +302,11 @@ def delete(ctx, name):
         vdc = VDC(client, resource=vdc_resource)
         task = vdc.delete_vdc()
         if name == in_use_vdc:
-            ctx.obj['profiles'].set('vdc_in_use', '')
-            ctx.obj['profiles'].set('vdc_href', '')
-            ctx.obj['profiles'].set('vapp_in_use', '')
-            ctx.obj['profiles'].set('vapp_href', '')
+            with ctx.obj['profiles'].transaction():
+                ctx.obj['profiles'].set('vdc_in_use', '')
+                ctx.obj['profiles'].set('vdc_href', '')
+                ctx.obj['profiles'].set('vapp_in_use', '')
+                ctx.obj['profiles'].set('vapp_href', '')
         stdout(task, ctx)
     except Exception as e:
         stderr(e, ctx)
@@ -23,6 +23,8 @@ from pyvcloud.vcd.vapp import VApp
 from pyvcloud.vcd.vdc import VDC
 from pyvcloud.vcd.vm import VM
 
+from vcd_cli.cache import invalidate
+from vcd_cli.cache import resolve_resource
 from vcd_cli.utils import restore_session
 from vcd_cli.utils import stderr
 from vcd_cli.utils import stdout
@@ -371,15 +373,21 @@ def _get_vdc(ctx):
 
 def _get_vapp(ctx, vapp_name):
     client = ctx.obj['client']
-    vdc = _get_vdc(ctx)
-    vapp_resource = vdc.get_vapp(vapp_name)
-    return VApp(client, resource=vapp_resource)
+    vdc_href = ctx.obj['profiles'].get('vdc_href')
+    return VApp(
+        client,
+        resource=resolve_resource(
+            ctx, ('vapp', vdc_href, vapp_name),
+            lambda: _get_vdc(ctx).get_vapp_href(vapp_name)))
 
 def _get_vm(ctx, vapp_name, vm_name):
     client = ctx.obj['client']
-    vapp = _get_vapp(ctx, vapp_name)
-    vm_resource = vapp.get_vm(vm_name)
-    return VM(client, href=vm_resource.get('href'))
+    vdc_href = ctx.obj['profiles'].get('vdc_href')
+    return VM(
+        client,
+        resource=resolve_resource(
+            ctx, ('vm', vdc_href, vapp_name, vm_name),
+            lambda: _get_vapp(ctx, vapp_name).get_vm(vm_name).get('href')))
 
 
 @vm.command(short_help='show VM details')
@@ -873,6 +881,8 @@ def move_to(ctx, vapp_name, vm_name, target_vapp_name, target_vm_name):
         task = vm.move_to(source_vapp_name=vapp_name,
                           target_vapp_name=target_vapp_name,
                           target_vm_name=target_vm_name)
+        invalidate(ctx, 'vm', ctx.obj['profiles'].get('vdc_href'), vapp_name,
+                   vm_name)
         stdout(task, ctx)
     except Exception as e:
         stderr(e, ctx)
@@ -886,6 +896,8 @@ def delete(ctx, vapp_name, vm_name):
         restore_session(ctx, vdc_required=True)
         vm = _get_vm(ctx, vapp_name, vm_name)
         task = vm.delete()
+        invalidate(ctx, 'vm', ctx.obj['profiles'].get('vdc_href'), vapp_name,
+                   vm_name)
         stdout(task, ctx)
     except Exception as e:
         stderr(e, ctx)
@@ -1293,6 +1305,9 @@ def update_general_setting(ctx, vapp_name, vm_name, name, description,
             boot_delay=boot_delay,
             enter_bios_setup=enter_bios_setup,
             storage_policy_href=storage_policy_href)
+        if name is not None:
+            invalidate(ctx, 'vm', ctx.obj['profiles'].get('vdc_href'),
+                       vapp_name, vm_name)
         stdout(task, ctx)
     except Exception as e:
         stderr(e, ctx)